@@ -0,0 +1,68 @@
+"""
+Compare the shapely based danger fitness with the vectorized OBB kernel.
+python -m benchmarks.bench_danger_fitness
+"""
+import time
+import argparse
+
+import numpy as np
+
+from types import SimpleNamespace
+from simulation import liability
+
+def make_state(x, z, heading, velocity):
+    return SimpleNamespace(transform=SimpleNamespace(position=SimpleNamespace(x=x, y=0.0, z=z),
+                                                     rotation=SimpleNamespace(x=0.0, y=heading, z=0.0)),
+                           velocity=SimpleNamespace(x=velocity[0], y=velocity[1], z=velocity[2]))
+
+def make_bbox(length, width):
+    return SimpleNamespace(min=SimpleNamespace(x=-width / 2.0, y=0.0, z=-length / 2.0),
+                           max=SimpleNamespace(x=width / 2.0, y=1.5, z=length / 2.0))
+
+def random_states(rng, frames, spread):
+    positions = np.cumsum(rng.normal(0, 0.5, size=(frames, 2)), axis=0) + rng.uniform(-spread, spread, size=2)
+    headings = rng.uniform(0, 360, size=frames)
+    velocities = rng.normal(0, 5, size=(frames, 3))
+    return [make_state(positions[i, 0], positions[i, 1], headings[i], velocities[i]) for i in range(frames)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--npcs', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    ego_bbox = make_bbox(4.7, 2.1)
+    ego_states = random_states(rng, args.frames, 5)
+    npcs = [(random_states(rng, args.frames, 10), make_bbox(4.5, 2.0)) for _ in range(args.npcs)]
+
+    start = time.perf_counter()
+    reference = []
+    for npc_states, npc_bbox in npcs:
+        for t in range(args.frames):
+            ego = {'state': ego_states[t], 'bbox': ego_bbox}
+            npc = {'state': npc_states[t], 'bbox': npc_bbox}
+            reference.append(liability.compute_danger_fitness(ego, npc, False))
+    shapely_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ego_traj = liability.stack_states(ego_states)
+    ego_extents = liability.bbox_half_extents(ego_bbox)
+    vectorized = []
+    for npc_states, npc_bbox in npcs:
+        npc_traj = liability.stack_states(npc_states)
+        vectorized.append(liability.compute_danger_fitness_batch(ego_traj, ego_extents, npc_traj, liability.bbox_half_extents(npc_bbox)))
+    vectorized = np.concatenate(vectorized)
+    kernel_time = time.perf_counter() - start
+
+    max_error = np.max(np.abs(np.array(reference) - vectorized))
+    print('pairs: ' + str(len(reference)))
+    print('shapely: ' + str(round(shapely_time * 1000, 2)) + ' ms')
+    print('kernel: ' + str(round(kernel_time * 1000, 2)) + ' ms (including state stacking)')
+    print('speedup: ' + str(round(shapely_time / kernel_time, 1)) + 'x')
+    print('max abs error: ' + str(max_error))
+    assert max_error < 1e-6
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Time of one roulette selection, nested-loop implementation (before mutation.selection) vs prefix sum + searchsorted.
+python -m benchmarks.bench_roulette --pop-size 2000
+"""
+import time
+import random
+import argparse
+import numpy as np
+
+from mutation import selection
+
+def legacy_roulette(fitness):
+    pop_size = len(fitness)
+    fitness = [0.001 if f == 0 else f for f in fitness]
+    min_fitness = min(fitness)
+    if min_fitness < 0:
+        fitness = [f - min_fitness for f in fitness]
+    sum_f = sum(fitness)
+    if sum_f == 0:
+        sum_f = 1
+    p = [f / sum_f for f in fitness]
+    q = [0] * pop_size
+    for i in range(0, pop_size):
+        s = 0
+        for j in range(0, i+1):
+            s += p[j]
+        q[i] = s
+    v = []
+    for i in range(0, pop_size):
+        r = random.random()
+        if r < q[0]:
+            v.append(0)
+        for j in range(1, pop_size):
+            if q[j - 1] < r <= q[j]:
+                v.append(j)
+    return v
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pop-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    fitness = rng.uniform(-1, 10, size=args.pop_size)
+
+    start = time.time()
+    legacy_roulette(fitness.tolist())
+    legacy_time = time.time() - start
+
+    params = selection.parse_selection('roulette')
+    start = time.time()
+    selection.select_indices(fitness, args.pop_size, rng, params)
+    new_time = time.time() - start
+
+    print('pop_size ' + str(args.pop_size))
+    print('nested loops:     ' + str(round(legacy_time * 1000, 2)) + ' ms')
+    print('prefix sum:       ' + str(round(new_time * 1000, 2)) + ' ms')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Time and allocations of one generation of selection + best tracking,
+deep-copy implementation (before copy-on-write) vs the current GeneticMutator.
+python -m benchmarks.bench_selection --pop-size 2000
+"""
+import copy
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+
+from loguru import logger
+from corpus.corpus import CorpusElement
+from mutation.genetic_algorithm import GeneticMutator
+
+def legacy_select_top2(pop, pop_size):
+    maxFitness = max(element.fitness for element in pop)
+    max2Fitness = max([element.fitness for element in pop if element.fitness != maxFitness] + [0])
+    v = []
+    for fitness in [maxFitness, max2Fitness]:
+        for element in pop:
+            if element.fitness == fitness:
+                for j in range(int(pop_size / 2.0)):
+                    v.append(copy.deepcopy(element))
+                break
+    return copy.deepcopy(v)
+
+def legacy_find_best(pop):
+    best = copy.deepcopy(pop[0])
+    for element in pop:
+        if best.fitness < element.fitness:
+            best = copy.deepcopy(element)
+    return best
+
+def random_pop(pop_size, npc_size, time_size):
+    pop = []
+    for i in range(pop_size):
+        scenario = [[[random.uniform(0, 30), random.randrange(0, 3)] for _ in range(time_size)] for _ in range(npc_size)]
+        pop.append(CorpusElement('scenario_' + str(i), scenario, random.uniform(0, 10)))
+    return pop
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--pop-size', type=int, default=2000)
+    parser.add_argument('--npc-size', type=int, default=2)
+    parser.add_argument('--time-size', type=int, default=10)
+    args = parser.parse_args()
+
+    logger.remove()
+    random.seed(0)
+    pop = random_pop(args.pop_size, args.npc_size, args.time_size)
+
+    def legacy():
+        new_pop = legacy_select_top2(pop, args.pop_size)
+        for _ in range(5): # find_best is called several times per generation
+            legacy_find_best(new_pop)
+
+    ga = GeneticMutator(None, 'top', tempfile.mkdtemp(), 'bench', [[0, 30], [0, 3]], 0.4, 0.4, args.pop_size, args.npc_size, args.time_size, 1)
+    def current():
+        ga.pop = list(pop)
+        ga.select()
+        for _ in range(5):
+            best, _ = ga.find_best()
+            best.clone()
+
+    for name, fn in [('deep copy', legacy), ('copy on write', current)]:
+        elapsed, peak = measure(fn)
+        print(name + ': ' + str(round(elapsed * 1000, 2)) + ' ms, peak allocation ' + str(round(peak / 1024.0, 1)) + ' KiB')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Similarity of restart candidates with all prior generations, per-pair python loops vs the distance matrix.
+python -m benchmarks.bench_similarity --candidates 1000 --generations 100
+"""
+import time
+import random
+import argparse
+import numpy as np
+
+from corpus.corpus import CorpusElement
+from mutation import tools, restart
+
+def random_scenario(npc_size, time_size):
+    return [[[random.uniform(0, 30), random.randrange(0, 3)] for _ in range(time_size)] for _ in range(npc_size)]
+
+def legacy_similarity(scenario, pre_pop_pool):
+    similarity = 0
+    for pre_pop in pre_pop_pool:
+        pop_similarity = 0
+        for element in pre_pop:
+            pop_similarity += tools.get_similarity_between_scenarios(scenario, element.scenario)
+        similarity += pop_similarity / len(pre_pop)
+    return similarity / len(pre_pop_pool)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--candidates', type=int, default=1000)
+    parser.add_argument('--generations', type=int, default=100)
+    parser.add_argument('--pop-size', type=int, default=4)
+    parser.add_argument('--npc-size', type=int, default=2)
+    parser.add_argument('--time-size', type=int, default=10)
+    args = parser.parse_args()
+
+    random.seed(0)
+    pre_pop_pool = [[CorpusElement('scenario', random_scenario(args.npc_size, args.time_size), 0) for _ in range(args.pop_size)] for _ in range(args.generations)]
+    candidates = [random_scenario(args.npc_size, args.time_size) for _ in range(args.candidates)]
+
+    start = time.time()
+    legacy = np.array([legacy_similarity(candidate, pre_pop_pool) for candidate in candidates])
+    legacy_time = time.time() - start
+
+    start = time.time()
+    batched = restart.get_similarity_vs_pre_pop(tools.stack_scenarios(candidates), pre_pop_pool)
+    batched_time = time.time() - start
+
+    print('candidates ' + str(args.candidates) + ', archive ' + str(args.generations) + ' x ' + str(args.pop_size))
+    print('python loops:     ' + str(round(legacy_time * 1000, 1)) + ' ms')
+    print('distance matrix:  ' + str(round(batched_time * 1000, 1)) + ' ms')
+    print('max abs error:    ' + str(np.abs(legacy - batched).max()))
+
+if __name__ == '__main__':
+    main()
@@ -2,15 +2,41 @@ class CorpusElement(object):
     """Class representing a single element of a corpus."""
 
     def __init__(self, scenario_id, scenario, fitness):
-        
+
         self.scenario = scenario # input data
         self.fitness = fitness # simulator output - fitness score or others
         self.parent = None
+        self.parent_id = None # scenario id the genome was varied from, kept instead of the parent object
         self.scenario_id = scenario_id
+        self.shared = False # scenario is shared with clones, copy before editing it in place
 
     def set_parent(self, parent):
         self.parent = parent
 
+    def clone(self):
+        """
+        Cheap copy for selection: the scenario is shared until one side edits it (see own_scenario)
+        """
+        element = CorpusElement(self.scenario_id, self.scenario, self.fitness)
+        element.parent = self.parent
+        element.parent_id = self.parent_id
+        element.shared = True
+        self.shared = True
+        return element
+
+    def own_scenario(self):
+        """
+        Make the scenario private to this element, call before editing it in place
+        """
+        if getattr(self, 'shared', False):
+            self.scenario = [[list(gene) for gene in npc] for npc in self.scenario]
+            self.shared = False
+        return self.scenario
+
+    def set_scenario(self, scenario):
+        self.scenario = scenario
+        self.shared = False
+
     def oldest_ancestor(self):
         """Returns the least recently created ancestor of this corpus item."""
         current_element = self
@@ -18,4 +44,4 @@ class CorpusElement(object):
         while current_element.parent is not None:
             current_element = current_element.parent
             generations += 1
-        return current_element, generations
\ No newline at end of file
+        return current_element, generations
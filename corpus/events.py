@@ -0,0 +1,285 @@
+import os
+import sys
+import glob
+import json
+import time
+import queue
+import atexit
+import argparse
+import threading
+
+from loguru import logger
+
+EVENTS_FILE = 'events.jsonl'
+
+def _ga_line(event):
+    if event['kind'] == 'evaluated':
+        return event['name'] + ',' + event['scenario_id'] + ',before run:' + str(event['before']) + ',after run:' + str(event['after'])
+    if event['kind'] == 'steady_eval':
+        return event['name'] + ',' + event['scenario_id'] + ',fitness:' + str(event['fitness']) + ',replaced:' + str(event['replaced'])
+    if event['kind'] == 'migration':
+        return event['name'] + ',sent:' + str(event['sent']) + ',received:' + str(event['received'])
+    return event['name'] + ',' + event['scenario_id'] # init, restart
+
+def _progress_line(event):
+    if event['kind'] == 'progress_header':
+        return 'name' + " " + "best_fitness" + " " + "global_best_fitness" + " " + "similarity" + " " + "datatime"
+    return event['name'] + " " + str(event['best_fitness']) + " " + str(event['global_best_fitness']) + " " + str(event['similarity']) + " " + event['date_time']
+
+def _case_state_line(event):
+    return ' '.join([event['scenario_id']] + [str(item) for item in event['faults']])
+
+# event kind -> (text view, line of the view)
+VIEWS = {
+    'init': ('ga.log', _ga_line),
+    'evaluated': ('ga.log', _ga_line),
+    'restart': ('ga.log', _ga_line),
+    'steady_eval': ('ga.log', _ga_line),
+    'migration': ('ga.log', _ga_line),
+    'progress_header': ('progress.log', _progress_line),
+    'progress': ('progress.log', _progress_line),
+    'case_state': ('case_states.log', _case_state_line)
+}
+
+class EventLog(object):
+    """
+    Structured event stream of a campaign: logs/events.jsonl, one {"kind": ..., "t": ..., fields} object per line.
+    emit() only queues the event, a background thread writes batches of up to batch_size events,
+    flushes every flush_interval seconds, fsyncs every fsync_interval seconds and rotates the file
+    to events.jsonl.<n> once it exceeds max_bytes.
+    ga.log, progress.log and case_states.log are views of the stream, rendered by the writer in the
+    same batches (VIEWS) and regenerated from the events with render().
+    """
+
+    def __init__(self, log_path, batch_size=256, flush_interval=0.5, fsync_interval=5.0, max_bytes=64 * 1024 * 1024):
+        self.log_path = log_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.events_file = os.path.join(log_path, EVENTS_FILE)
+        os.makedirs(log_path, exist_ok=True)
+
+        self._queue = queue.Queue()
+        self._file = open(self.events_file, 'a')
+        self._last_fsync = time.time()
+        self._thread = threading.Thread(target=self._write_loop, name='event_log', daemon=True)
+        self._thread.start()
+
+    def emit(self, kind, **fields):
+        event = {'kind': kind, 't': time.time()}
+        event.update(fields)
+        self._queue.put(event)
+
+    def _write_loop(self):
+        closing = False
+        while not closing:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                closing = True
+                batch = [event for event in batch if event is not None]
+            try:
+                self._write(batch, force_sync=closing)
+            except Exception as e:
+                logger.error('Event log ' + self.events_file + ' failed to write ' + str(len(batch)) + ' events: ' + str(e))
+        self._file.close()
+
+    def _write(self, batch, force_sync=False):
+        views = {}
+        lines = []
+        for event in batch:
+            lines.append(json.dumps(event, separators=(',', ':'), default=str))
+            if event['kind'] in VIEWS:
+                view, line = VIEWS[event['kind']]
+                views.setdefault(view, []).append(line(event))
+        if len(lines) > 0:
+            self._file.write('\n'.join(lines) + '\n')
+        self._file.flush()
+        for view, view_lines in views.items():
+            with open(os.path.join(self.log_path, view), 'a') as f:
+                f.write('\n'.join(view_lines) + '\n')
+
+        now = time.time()
+        if force_sync or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.events_file, self.events_file + '.' + str(len(rotated_files(self.log_path)) + 1))
+        self._file = open(self.events_file, 'a')
+
+    def close(self):
+        """
+        Write all queued events and stop the writer
+        """
+        if not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join()
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+def open_log(log_path, **cfgs):
+    """
+    The EventLog of a logs folder, shared by everything of the campaign running in this process.
+    cfgs only apply to the call that creates it.
+    """
+    key = os.path.abspath(log_path)
+    with _logs_lock:
+        if key not in _logs:
+            _logs[key] = EventLog(log_path, **cfgs)
+        return _logs[key]
+
+def close_log(log_path):
+    with _logs_lock:
+        event_log = _logs.pop(os.path.abspath(log_path), None)
+    if event_log is not None:
+        event_log.close()
+
+@atexit.register
+def close_logs():
+    with _logs_lock:
+        event_logs = list(_logs.values())
+        _logs.clear()
+    for event_log in event_logs:
+        event_log.close()
+
+def rotated_files(log_path):
+    """
+    Rotated event files, oldest first
+    """
+    files = glob.glob(os.path.join(log_path, EVENTS_FILE + '.*'))
+    return sorted(files, key=_rotation_number)
+
+def _matches(line, kinds, since, fields):
+    # kind is the first key of every line, skip json parsing of other kinds
+    if kinds is not None and not any(line.startswith('{"kind":"' + kind + '"') for kind in kinds):
+        return None
+    try:
+        event = json.loads(line)
+    except ValueError:
+        return None # line cut by a crash
+    if since is not None and event['t'] < since:
+        return None
+    for key, value in fields.items():
+        if str(event.get(key)) != str(value):
+            return None
+    return event
+
+def _rotation_number(path):
+    return int(path.rsplit('.', 1)[1])
+
+def read_events(log_path, kinds=None, since=None, follow=False, poll_interval=0.5, **fields):
+    """
+    Events of a logs folder in write order, rotated files first.
+    kinds: only these kinds, since: only events at or after this unix time, fields: equality filters (e.g. name='global_3').
+    follow: keep waiting for new events (tail -f), across rotations.
+    """
+    events_file = os.path.join(log_path, EVENTS_FILE)
+    done = 0 # rotated files read so far
+    f = None
+    partial = ''
+    try:
+        while True:
+            for path in rotated_files(log_path):
+                if _rotation_number(path) <= done:
+                    continue
+                if f is not None and os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                    # the file being tailed was rotated, it is complete
+                    lines = (partial + f.read()).splitlines()
+                    partial = ''
+                    f.close()
+                    f = None
+                else:
+                    with open(path, 'r') as rotated:
+                        lines = rotated.read().splitlines()
+                for line in lines:
+                    event = _matches(line, kinds, since, fields)
+                    if event is not None:
+                        yield event
+                done = _rotation_number(path)
+
+            if f is None:
+                if os.path.isfile(events_file):
+                    f = open(events_file, 'r')
+                    continue # files rotated before the open are read first
+                if not follow:
+                    return
+                time.sleep(poll_interval)
+                continue
+
+            while True:
+                line = f.readline()
+                if not line.endswith('\n'):
+                    partial += line
+                    break
+                event = _matches(partial + line, kinds, since, fields)
+                partial = ''
+                if event is not None:
+                    yield event
+            if not follow:
+                return
+            time.sleep(poll_interval)
+    finally:
+        if f is not None:
+            f.close()
+
+def render(log_path, output_path=None):
+    """
+    Regenerate the text views (ga.log, progress.log, case_states.log) from the events of a logs folder
+    """
+    output_path = output_path if output_path else log_path
+    os.makedirs(output_path, exist_ok=True)
+    view_files = {}
+    try:
+        for event in read_events(log_path, kinds=list(VIEWS)):
+            view, line = VIEWS[event['kind']]
+            if view not in view_files:
+                view_files[view] = open(os.path.join(output_path, view), 'w')
+            view_files[view].write(line(event) + '\n')
+    finally:
+        for f in view_files.values():
+            f.close()
+    return sorted(view_files)
+
+def events_main(argv):
+    """
+    python -m corpus.events <logs dir> [--kind K] [--since T] [--field key=value] [--follow] [--render out dir]
+    """
+    parser = argparse.ArgumentParser(prog='python -m corpus.events', description='Filter, tail or render the event log of a campaign.')
+    parser.add_argument('log_path', type=str, help='logs folder of a campaign (output_path/logs).')
+    parser.add_argument('--kind', type=str, action='append', help='Event kind, repeat for several: ' + ', '.join(VIEWS) + ', ...')
+    parser.add_argument('--since', type=float, default=None, help='Unix time of the first event.')
+    parser.add_argument('--field', type=str, action='append', default=[], help='key=value equality filter, e.g. name=global_3.')
+    parser.add_argument('--follow', action='store_true', help='Keep printing new events.')
+    parser.add_argument('--render', type=str, default=None, help='Write ga.log, progress.log and case_states.log to this folder.')
+    args = parser.parse_args(argv[1:])
+
+    if args.render is not None:
+        views = render(args.log_path, args.render)
+        print('Rendered ' + ', '.join(views) + ' to ' + args.render)
+        return 0
+
+    fields = dict(field.split('=', 1) for field in args.field)
+    try:
+        for event in read_events(args.log_path, args.kind, args.since, args.follow, **fields):
+            print(json.dumps(event, separators=(',', ':')), flush=True)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(events_main(sys.argv))
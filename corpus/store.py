@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import pickle
+import threading
+import numpy as np
+
+from datetime import datetime
+
+from corpus.corpus import CorpusElement
+
+ID_DTYPE = 'S64'
+
+class CampaignStore(object):
+    """
+    Append-only columnar store of every checkpointed population of a campaign (global GA, LIS runs and best).
+    Each column is a memory-mapped file of capacity rows, grown by doubling:
+        genomes.f8      (capacity, npc_size, time_size, 2)
+        fitness.f8      (capacity,)
+        scenario_id.S64 (capacity,)
+        generation.i4   (capacity,)
+        run.i4          (capacity,) index into index.json runs, e.g. global, best, local_12
+        parent.i8       (capacity,) row of the parent scenario, -1 if unknown
+    segments.jsonl gets one [run, generation, start, end, time] line per append, so a checkpointed population is
+    the contiguous, zero-copy rows start:end. index.json holds the shapes, the row count and the run names.
+    Columns and segments are flushed before index.json is replaced, the index never points at unwritten rows
+    and segments past its row count are ignored.
+    """
+
+    COLUMNS = {
+        'genomes': 'f8',
+        'fitness': 'f8',
+        'scenario_id': ID_DTYPE,
+        'generation': 'i4',
+        'run': 'i4',
+        'parent': 'i8'
+    }
+
+    def __init__(self, path, index, mode='r+'):
+        self.path = path
+        self.mode = mode
+        self.npc_size = index['npc_size']
+        self.time_size = index['time_size']
+        self.capacity = index['capacity']
+        self.size = index['size']
+        self.runs = index['runs']
+        self.segments = {} # run index -> [[generation, start, end, time]]
+        segments_file = os.path.join(path, 'segments.jsonl')
+        dropped = False
+        if os.path.isfile(segments_file):
+            with open(segments_file, 'r') as f:
+                for line in f:
+                    try:
+                        run_index, generation, start, end, stamp = json.loads(line)
+                    except ValueError:
+                        dropped = True
+                        continue
+                    if end > self.size:
+                        dropped = True
+                        continue
+                    self.segments.setdefault(run_index, []).append([generation, start, end, stamp])
+        if dropped and mode == 'r+':
+            # an append was interrupted before the index was updated, its rows will be overwritten
+            with open(segments_file + '.tmp', 'w') as f:
+                for run_index, segments in self.segments.items():
+                    for segment in segments:
+                        f.write(json.dumps([run_index] + segment) + '\n')
+            os.replace(segments_file + '.tmp', segments_file)
+        self._lock = threading.Lock()
+        self._rows_by_id = None
+        self._columns = self._map_columns()
+
+    @classmethod
+    def create(cls, path, npc_size, time_size, capacity=1024):
+        os.makedirs(path, exist_ok=True)
+        index = {'npc_size': npc_size, 'time_size': time_size, 'capacity': capacity, 'size': 0, 'runs': []}
+        open(os.path.join(path, 'segments.jsonl'), 'w').close()
+        for name, dtype in cls.COLUMNS.items():
+            with open(os.path.join(path, name + '.' + dtype), 'wb') as f:
+                f.truncate(capacity * cls._row_bytes(name, dtype, npc_size, time_size))
+        store = cls(path, index)
+        store._write_index()
+        return store
+
+    @classmethod
+    def open(cls, path, mode='r'):
+        """
+        mode r: read only views, r+: append to an existing store (e.g. a resumed campaign)
+        """
+        with open(os.path.join(path, 'index.json'), 'r') as f:
+            index = json.load(f)
+        return cls(path, index, mode)
+
+    @staticmethod
+    def _row_bytes(name, dtype, npc_size, time_size):
+        row = np.dtype(dtype).itemsize
+        if name == 'genomes':
+            row *= npc_size * time_size * 2
+        return row
+
+    def _shape(self, name, rows):
+        if name == 'genomes':
+            return (rows, self.npc_size, self.time_size, 2)
+        return (rows,)
+
+    def _map_columns(self):
+        rows = self.capacity if self.mode == 'r+' else self.size
+        columns = {}
+        for name, dtype in self.COLUMNS.items():
+            if rows == 0:
+                columns[name] = np.empty(self._shape(name, 0), dtype=dtype)
+                continue
+            columns[name] = np.memmap(os.path.join(self.path, name + '.' + dtype), dtype=dtype, mode=self.mode, shape=self._shape(name, rows))
+        return columns
+
+    def _grow(self, rows):
+        capacity = self.capacity
+        while capacity < rows:
+            capacity *= 2
+        for name, dtype in self.COLUMNS.items():
+            self._columns[name].flush()
+        for name, dtype in self.COLUMNS.items():
+            with open(os.path.join(self.path, name + '.' + dtype), 'r+b') as f:
+                f.truncate(capacity * self._row_bytes(name, dtype, self.npc_size, self.time_size))
+        self.capacity = capacity
+        # readers do not take the lock: they keep using the old maps (still valid, the files only grew)
+        # until the new ones are swapped in with one assignment
+        self._columns = self._map_columns()
+
+    def _write_index(self):
+        index = {
+            'npc_size': self.npc_size,
+            'time_size': self.time_size,
+            'capacity': self.capacity,
+            'size': self.size,
+            'runs': self.runs
+        }
+        index_file = os.path.join(self.path, 'index.json')
+        with open(index_file + '.tmp', 'w') as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(index_file + '.tmp', index_file)
+
+    def run_index(self, run):
+        if run not in self.runs:
+            self.runs.append(run)
+        return self.runs.index(run)
+
+    def _id_lookup(self):
+        if self._rows_by_id is None:
+            self._rows_by_id = {}
+            for row, stored_id in enumerate(self.column('scenario_id')):
+                self._rows_by_id[stored_id.decode()] = row
+        return self._rows_by_id
+
+    def row_of(self, scenario_id):
+        """
+        Latest row holding scenario_id, -1 if it was never stored
+        """
+        return self._id_lookup().get(str(scenario_id), -1)
+
+    def append(self, elements, generation, run='global'):
+        """
+        Store a population (list of CorpusElement) as one segment, returns its (start, end) rows.
+        Amortized O(len(elements)), independent of the store size.
+        """
+        with self._lock:
+            rows_by_id = self._id_lookup()
+            start = self.size
+            end = start + len(elements)
+            if end > self.capacity:
+                self._grow(end)
+
+            run_index = self.run_index(run)
+            columns = self._columns
+            columns['genomes'][start:end] = np.asarray([element.scenario for element in elements], dtype=float)
+            columns['fitness'][start:end] = [element.fitness if element.fitness is not None else np.nan for element in elements]
+            columns['scenario_id'][start:end] = [str(element.scenario_id).encode() for element in elements]
+            columns['generation'][start:end] = generation
+            columns['run'][start:end] = run_index
+            parents = []
+            for element in elements:
+                parent_id = getattr(element, 'parent_id', None)
+                if parent_id is None and getattr(element, 'parent', None) is not None:
+                    parent_id = element.parent.scenario_id
+                parents.append(rows_by_id.get(str(parent_id), -1) if parent_id is not None else -1)
+            columns['parent'][start:end] = parents
+            for name in self.COLUMNS:
+                columns[name].flush()
+
+            for row, element in enumerate(elements, start):
+                rows_by_id[str(element.scenario_id)] = row
+            segment = [generation, start, end, time.time()]
+            with open(os.path.join(self.path, 'segments.jsonl'), 'a') as f:
+                f.write(json.dumps([run_index] + segment) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.segments.setdefault(run_index, []).append(segment)
+            self.size = end
+            self._write_index()
+        return start, end
+
+    def set_best(self, element, generation, run='global'):
+        """
+        Record the best element so far of a run, appended only when it changed
+        """
+        best = self.best(run)
+        if best is not None and best.scenario_id == str(element.scenario_id) and best.fitness == element.fitness:
+            return
+        self.append([element], generation, 'best' if run == 'global' else run + '/best')
+
+    def column(self, name):
+        """
+        Zero-copy view of the stored rows of a column
+        """
+        size = self.size
+        return self._columns[name][:size]
+
+    def segment_rows(self, run='global'):
+        """
+        [(generation, start, end, time)] of the segments of a run, in append order
+        """
+        if run not in self.runs:
+            return []
+        return [tuple(segment) for segment in list(self.segments.get(self.runs.index(run), []))]
+
+    def generation(self, generation, run='global'):
+        """
+        Zero-copy (genomes, fitness) of the latest segment of a generation
+        """
+        columns = self._columns
+        for g, start, end, _ in reversed(self.segment_rows(run)):
+            if g == generation:
+                return columns['genomes'][start:end], columns['fitness'][start:end]
+        raise KeyError(str(run) + ' generation ' + str(generation))
+
+    def elements(self, start, end):
+        """
+        Rows start:end as CorpusElement objects, in the nested-list scenario format
+        """
+        columns = self._columns
+        genomes = columns['genomes'][start:end]
+        fitness = columns['fitness'][start:end]
+        ids = columns['scenario_id'][start:end]
+        elements = []
+        for k in range(end - start):
+            scenario = [[[v, int(a)] for v, a in npc] for npc in genomes[k].tolist()]
+            elements.append(CorpusElement(ids[k].decode(), scenario, float(fitness[k])))
+        return elements
+
+    def export_pickles(self, output_path):
+        """
+        Write the pickle checkpoints of the previous layout:
+            logs/checkpoints_ga/{best_scenario.obj, last_gen.obj, generation-<i>-at-<time>} for the global GA
+            local_ga/<run>/logs/checkpoints_ga/... for every LIS run
+        """
+        for run in self.runs:
+            if run == 'best' or run.endswith('/best'):
+                continue
+            if run == 'global':
+                ck_path = os.path.join(output_path, 'logs/checkpoints_ga')
+            else:
+                ck_path = os.path.join(output_path, 'local_ga', run, 'logs/checkpoints_ga')
+            os.makedirs(ck_path, exist_ok=True)
+
+            segments = self.segment_rows(run)
+            for generation, start, end, stamp in segments:
+                date_time = datetime.fromtimestamp(stamp).strftime("%m-%d-%Y-%H-%M-%S")
+                with open(os.path.join(ck_path, 'generation-' + str(generation) + '-at-' + date_time), 'wb') as f:
+                    pickle.dump(self.elements(start, end), f)
+            if len(segments) == 0:
+                continue
+            _, start, end, _ = segments[-1]
+            with open(os.path.join(ck_path, 'last_gen.obj'), 'wb') as f:
+                pickle.dump(self.elements(start, end), f)
+
+            best = self.best(run)
+            if best is not None:
+                with open(os.path.join(ck_path, 'best_scenario.obj'), 'wb') as f:
+                    pickle.dump(best, f)
+
+    def best(self, run='global'):
+        """
+        Latest best element recorded for a run (the 'best' run of the global GA, '<run>/best' for LIS runs)
+        """
+        best_run = 'best' if run == 'global' else run + '/best'
+        if best_run not in self.runs:
+            return None
+        segments = self.segments.get(self.runs.index(best_run), [])
+        if len(segments) == 0:
+            return None
+        _, start, end, _ = segments[-1]
+        return self.elements(start, end)[0]
+
+def export_main(argv):
+    """
+    python -m corpus.store <campaign_store dir> <output dir>: write the old pickle checkpoint layout
+    """
+    if len(argv) != 3:
+        print('usage: python -m corpus.store <campaign_store dir> <output dir>')
+        return 1
+    store = CampaignStore.open(argv[1])
+    store.export_pickles(argv[2])
+    print('Exported ' + str(store.size) + ' rows of ' + str(len(store.runs)) + ' runs to ' + argv[2])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(export_main(sys.argv))
@@ -1,61 +1,197 @@
 import os
 import sys
+import queue
+import pickle
+import random
 import yaml
+import multiprocessing
 import argparse
 
 from loguru import logger
 from datetime import datetime
 from mutation.genetic_algorithm import GeneticMutator
+from mutation.steady_state import SteadyStateMutator
+from mutation.island import Migration, merge_progress_logs
 from simulation.run_parse import Runner
+from corpus.events import open_log
 
 level = "INFO"
 logger.configure(handlers=[{"sink": sys.stderr, "level": level}]) # TODO: fix file output
 
 class Fuzzer(object):
 
-    def __init__(self, cfgs):
+    def __init__(self, cfgs, migration=None, resume=False):
         now = datetime.now()
         date_time = now.strftime("%m-%d-%Y-%H-%M-%S")
 
         self.cfgs = cfgs
-        cfgs['output_path'] = cfgs['output_path'] + '-at-' + date_time
+        if cfgs.get('seed') is not None:
+            random.seed(cfgs['seed'])
+        if migration is None and not resume:
+            cfgs['output_path'] = cfgs['output_path'] + '-at-' + date_time
         self.output_path = cfgs['output_path']
         self.scenario_name = os.path.basename(cfgs['scenario_env_json']).split('.')[0]
 
         if not os.path.exists(self.output_path):
             os.makedirs(self.output_path)
         log_file = os.path.join(self.output_path, 'logs/system.log')
-        if os.path.exists(log_file):
+        if os.path.exists(log_file) and not resume:
             os.remove(log_file)
         logger.add(log_file, level=level)
         self.record_cfgs()
+        if not resume:
+            self.save_cfgs()
+        open_log(os.path.join(self.output_path, 'logs'), **self.cfgs.get('events', {}))
 
         self.runner = Runner(cfgs['scenario_env_json'],
                              self.output_path,
                              self.cfgs['total_sim_time'],
                              self.cfgs['default_record_folder'],
                              self.cfgs['lgsvl_map'],
-                             self.cfgs['apollo_map'])
-        self.mutation_runner = GeneticMutator(self.runner, self.cfgs['selection'], self.output_path, self.scenario_name, cfgs['bounds'], cfgs['p_mutation'], cfgs['p_crossover'], cfgs['pop_size'], cfgs['npc_size'], cfgs['time_size'], cfgs['max_gen'])
-        self.mutation_runner.init_pop()
-        logger.info('Initilized Genetic Mutator.')
+                             self.cfgs['apollo_map'],
+                             self.cfgs.get('simulators'),
+                             self.cfgs.get('fitness_cache'),
+                             self.run_cfgs(),
+                             resume,
+                             self.cfgs.get('results_db'),
+                             self.cfgs.get('trajectories'))
+        ga_args = (self.runner, self.cfgs['selection'], self.output_path, self.scenario_name, cfgs['bounds'], cfgs['p_mutation'], cfgs['p_crossover'], cfgs['pop_size'], cfgs['npc_size'], cfgs['time_size'], cfgs['max_gen'], cfgs.get('population_backend', 'list'), cfgs.get('seed'), cfgs.get('diversity_sample_size'), cfgs.get('surrogate'), cfgs.get('lis'))
+        ga_mode = cfgs.get('ga_mode', 'generational')
+        if ga_mode == 'generational':
+            self.mutation_runner = GeneticMutator(*ga_args, resume=resume)
+        elif ga_mode == 'steady_state':
+            self.mutation_runner = SteadyStateMutator(*ga_args, steady_state_cfgs=cfgs.get('steady_state'), resume=resume)
+        else:
+            raise RuntimeError('GA modes require: generational or steady_state.')
+        self.mutation_runner.migration = migration
+        if resume and self.mutation_runner.restore():
+            logger.info('Resumed Genetic Mutator from ' + self.output_path)
+        else:
+            self.mutation_runner.init_pop()
+            logger.info('Initilized Genetic Mutator.')
 
     def loop(self):
         self.mutation_runner.process()
+        self.runner.close()
+
+    def run_cfgs(self):
+        # options of a single simulation run, shared by all simulator workers
+        return {
+            'stop_rules': self.cfgs.get('stop_rules', {}),
+            'status_max_age': self.cfgs.get('status_max_age', 2.0),
+            'warm_apollo': self.cfgs.get('warm_apollo', True),
+            'readiness': self.cfgs.get('readiness', {}),
+            'adaptive_step': self.cfgs.get('adaptive_step', {})
+        }
 
     def record_cfgs(self):
         logger.info('Record fuzzer configs:')
         for k, v in self.cfgs.items():
             logger.info(str(k) + ' : ' + str(v))
 
+    def save_cfgs(self):
+        # the configs a --resume of this output folder runs with
+        os.makedirs(os.path.join(self.output_path, 'logs'), exist_ok=True)
+        with open(os.path.join(self.output_path, 'logs/config.yaml'), 'w') as f:
+            yaml.safe_dump(self.cfgs, f)
+
+def run_island(cfgs, migration):
+    fuzzer = Fuzzer(cfgs, migration)
+    fuzzer.loop()
+    migration.events.put(('done', migration.island_id, None))
+
+class IslandFuzzer(object):
+    """
+    K GA populations in separate processes, island k runs on simulators[k % len(simulators)]
+    and writes to output_path/island_k. Islands exchange migrants through multiprocessing queues,
+    this process keeps the merged global best and merges the progress logs at the end.
+    """
+
+    def __init__(self, cfgs):
+        now = datetime.now()
+        date_time = now.strftime("%m-%d-%Y-%H-%M-%S")
+
+        self.cfgs = cfgs
+        cfgs['output_path'] = cfgs['output_path'] + '-at-' + date_time
+        self.output_path = cfgs['output_path']
+        os.makedirs(os.path.join(self.output_path, 'logs'), exist_ok=True)
+        logger.add(os.path.join(self.output_path, 'logs/system.log'), level=level)
+
+        island_cfgs = cfgs.get('islands', {})
+        simulator_cfgs = cfgs.get('simulators') or [{}]
+        self.island_num = island_cfgs.get('count') or len(simulator_cfgs)
+
+        context = multiprocessing.get_context('spawn')
+        inboxes = [context.Queue() for _ in range(self.island_num)]
+        self.events = context.Queue()
+        self.g_best = None
+        self.island_paths = []
+        self.processes = []
+        for k in range(self.island_num):
+            island_cfg = dict(cfgs)
+            island_cfg['output_path'] = os.path.join(self.output_path, 'island_' + str(k))
+            island_cfg['simulators'] = [simulator_cfgs[k % len(simulator_cfgs)]]
+            if cfgs.get('seed') is not None:
+                island_cfg['seed'] = cfgs['seed'] + k
+            cache_cfgs = cfgs.get('fitness_cache')
+            if cache_cfgs and cache_cfgs.get('path'):
+                # one cache file per island, each island rewrites its whole file every save_every puts
+                root, ext = os.path.splitext(cache_cfgs['path'])
+                island_cfg['fitness_cache'] = dict(cache_cfgs, path=root + '.island_' + str(k) + ext)
+            migration = Migration(k, inboxes, self.events,
+                                  island_cfgs.get('topology', 'ring'),
+                                  island_cfgs.get('interval', 5),
+                                  island_cfgs.get('migrants', 1))
+            self.island_paths.append(island_cfg['output_path'])
+            self.processes.append(context.Process(target=run_island, args=(island_cfg, migration), name='island_' + str(k)))
+        logger.info('Island mode: ' + str(self.island_num) + ' islands, ' + str(island_cfgs.get('topology', 'ring')) + ' topology')
+
+    def loop(self):
+        for process in self.processes:
+            process.start()
+
+        running = set(range(self.island_num))
+        while len(running) > 0:
+            try:
+                event, island_id, element = self.events.get(timeout=1.0)
+            except queue.Empty:
+                running = set(k for k in running if self.processes[k].is_alive())
+                continue
+            if event == 'done':
+                running.discard(island_id)
+            elif event == 'best' and (self.g_best is None or element.fitness > self.g_best.fitness):
+                self.g_best = element
+                with open(os.path.join(self.output_path, 'logs/best_scenario.obj'), 'wb') as f:
+                    pickle.dump(self.g_best, f)
+                logger.info(' === Global best from island ' + str(island_id) + ': ' + str(element.scenario_id) + ' fitness ' + str(element.fitness))
+
+        for process in self.processes:
+            process.join()
+        merge_progress_logs([os.path.join(path, 'logs/progress.log') for path in self.island_paths],
+                            os.path.join(self.output_path, 'logs/progress.log'))
+        return self.g_best
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Apollo AV-Fuzzer Testing.')
     parser.add_argument('--config', type=str, help='Test config yaml file.', default='configs/config_ds_1.yaml')
+    parser.add_argument('--resume', type=str, help='Output folder of an interrupted run, continued with its logs/config.yaml.', default=None)
     args = parser.parse_args()
 
+    if args.resume is not None:
+        with open(os.path.join(args.resume, 'logs/config.yaml'), 'r') as f:
+            params = yaml.safe_load(f)
+        # an island folder (<output>/island_k) continues as a standalone GA, without migration
+        params['output_path'] = args.resume
+        fuzzer = Fuzzer(params, resume=True)
+        fuzzer.loop()
+        sys.exit(0)
+
     yaml_file = args.config
     with open(yaml_file, 'r') as f:
         params = yaml.safe_load(f)
 
-    fuzzer = Fuzzer(params)
+    if params.get('islands', {}).get('enabled', False):
+        fuzzer = IslandFuzzer(params)
+    else:
+        fuzzer = Fuzzer(params)
     fuzzer.loop()
\ No newline at end of file
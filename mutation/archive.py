@@ -0,0 +1,89 @@
+import numpy as np
+
+from mutation import tools
+
+class GenerationArchive(object):
+    """
+    Append-only in-memory archive of the generations of a GA run.
+    Genomes of all generations are kept in one contiguous (capacity, npc_size, time_size, 2) array,
+    generation g is genomes[boundaries[g]:boundaries[g + 1]].
+    The checkpoint files stay the persistent copy, the GA never reads them back.
+    """
+
+    def __init__(self, npc_size, time_size, capacity=64):
+        self._genomes = np.empty((capacity, npc_size, time_size, 2))
+        self._fitness = np.empty(capacity)
+        self.scenario_ids = []
+        self.boundaries = [0]
+
+    @classmethod
+    def from_pool(cls, pre_pop_pool):
+        """
+        list of generations (lists of CorpusElement, e.g. from restart.get_all_checkpoints) -> archive
+        """
+        first = pre_pop_pool[0][0].scenario
+        archive = cls(len(first), len(first[0]), sum(len(pre_pop) for pre_pop in pre_pop_pool))
+        for pre_pop in pre_pop_pool:
+            archive.append(pre_pop)
+        return archive
+
+    def __len__(self):
+        return len(self.boundaries) - 1
+
+    @property
+    def size(self):
+        return self.boundaries[-1]
+
+    @property
+    def genomes(self):
+        return self._genomes[:self.size]
+
+    @property
+    def fitness(self):
+        return self._fitness[:self.size]
+
+    @property
+    def pop_sizes(self):
+        return np.diff(self.boundaries)
+
+    def _reserve(self, size):
+        capacity = self._genomes.shape[0]
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        genomes = np.empty((capacity,) + self._genomes.shape[1:])
+        genomes[:self.size] = self.genomes
+        fitness = np.empty(capacity)
+        fitness[:self.size] = self.fitness
+        self._genomes = genomes
+        self._fitness = fitness
+
+    def append(self, pop):
+        """
+        Add a generation (list of CorpusElement), returns its generation index
+        """
+        start = self.size
+        end = start + len(pop)
+        self._reserve(end)
+        self._genomes[start:end] = tools.stack_scenarios(pop)
+        self._fitness[start:end] = [element.fitness if element.fitness is not None else np.nan for element in pop]
+        self.scenario_ids.extend(element.scenario_id for element in pop)
+        self.boundaries.append(end)
+        return len(self) - 1
+
+    def generation(self, g):
+        """
+        (genomes, fitness) views of generation g
+        """
+        start, end = self.boundaries[g], self.boundaries[g + 1]
+        return self._genomes[start:end], self._fitness[start:end]
+
+    def similarity(self, genomes, chunk_size=256):
+        """
+        (n, npc_size, time_size, 2) genomes -> (n,) mean distance to each archived generation, averaged over generations
+        """
+        distances = tools.get_distance_matrix(genomes, self.genomes, chunk_size)
+        pop_sizes = self.pop_sizes
+        pop_similarity = np.add.reduceat(distances, self.boundaries[:-1], axis=1) / pop_sizes
+        return pop_similarity.mean(axis=1)
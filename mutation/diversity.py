@@ -0,0 +1,55 @@
+import math
+import numpy as np
+
+from mutation import tools
+
+class DiversityTracker(object):
+    """
+    Similarity of the latest generation with all archived generations, the number logged in progress.log:
+    the distance to each generation averaged over its individuals, then over generations.
+
+    exact mode (sample_size None): only the block of the new generation against the archive is computed,
+    pop_size * archive.size scenario distances, so a run of G generations costs O(G^2 * pop_size^2) in total.
+    The distance is not decomposable, the block cannot be reused from earlier generations.
+    sampled mode: compares with sample_size archived individuals drawn with probability 1 / (G * pop_size of their
+    generation), an unbiased estimate whose error bound is z standard errors (z = 1.96: about 95% confidence),
+    pop_size * sample_size distances per generation.
+    """
+
+    def __init__(self, archive, sample_size=None, z=1.96, rng=None, chunk_size=256):
+        self.archive = archive
+        self.sample_size = sample_size
+        self.z = z
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.chunk_size = chunk_size
+
+        self.latest = (0.0, 0.0)
+
+    def update(self):
+        """
+        Call after every archive.append, returns (similarity, error bound) of the appended generation
+        """
+        genomes, _ = self.archive.generation(len(self.archive) - 1)
+        if self.sample_size is not None:
+            self.latest = self.measure(genomes)
+            return self.latest
+
+        # distances of the new generation with the archive, including itself
+        distances = tools.get_distance_matrix(genomes, self.archive.genomes, self.chunk_size)
+        means = (np.add.reduceat(distances, self.archive.boundaries[:-1], axis=1) / self.archive.pop_sizes).mean(axis=0)
+        self.latest = (float(means.mean()), 0.0)
+        return self.latest
+
+    def measure(self, genomes):
+        """
+        (similarity, error bound) of any (n, npc_size, time_size, 2) population, e.g. one created by a restart
+        """
+        if self.sample_size is None or self.sample_size >= self.archive.size:
+            return float(self.archive.similarity(genomes, self.chunk_size).mean()), 0.0
+
+        pop_sizes = self.archive.pop_sizes
+        weights = np.repeat(1.0 / (len(pop_sizes) * pop_sizes), pop_sizes)
+        sample = self.rng.choice(self.archive.size, size=self.sample_size, p=weights / weights.sum())
+        distances = tools.get_distance_matrix(genomes, self.archive.genomes[sample], self.chunk_size).mean(axis=0)
+        error = self.z * float(distances.std(ddof=1)) / math.sqrt(self.sample_size)
+        return float(distances.mean()), error
@@ -1,19 +1,29 @@
 import os
-import copy
-import random
 import pickle
-import shutil
+import random
+import numpy as np
 
 from datetime import datetime
 from loguru import logger
 
 from corpus.corpus import CorpusElement
+from corpus.store import CampaignStore
+from corpus.events import open_log
 from mutation.local_genetic_algorithm import LocalGeneticMutator
+from mutation.population import ArrayPopulation
+from mutation.selection import parse_selection, select_indices
 from mutation import restart
+from mutation import tools
+from mutation.archive import GenerationArchive
+from mutation.diversity import DiversityTracker
+from mutation.surrogate import Surrogate
+from mutation.lis_scheduler import LisScheduler
 
 class GeneticMutator(object):
-    def __init__(self, runner, selection, output_path, scenario_name, bounds, pm, pc, pop_size, NPC_size, time_size, max_gen):
+    def __init__(self, runner, selection, output_path, scenario_name, bounds, pm, pc, pop_size, NPC_size, time_size, max_gen, population_backend='list', seed=None, diversity_sample_size=None, surrogate_cfgs=None, lis_cfgs=None, resume=False):
         self.pop = []
+        self.population_backend = population_backend # list: per gene python loops, array: vectorized ArrayPopulation operators
+        self.rng = np.random.default_rng(seed)
         self.bounds = bounds                # The value ranges of the inner most elements
         self.pm = pm
         self.pc = pc
@@ -25,39 +35,140 @@ class GeneticMutator(object):
         self.bestIndex = 0
         self.g_best = None
         self.touched_chs = []             # Record which chromosomes have been touched in each generation
+        self.migration = None               # island mode: mutation.island.Migration of this island
 
         self.minLisGen = 2                  # Min gen to start LIS
         self.numOfGenInLis = 5              # Number of gens in LIS
         self.hasRestarted = False
         self.lastRestartGen = 0
         self.bestYAfterRestart = 0
+        self.next_generation = 0            # first generation process() runs, set by restore()
 
         self.runner = runner
-        self.selection = selection
+        self.selection = parse_selection(selection)
         self.scenario_name = scenario_name
         self.output_path = output_path
-        self.ga_checkpoints_path = os.path.join(self.output_path, 'logs/checkpoints_ga')
-
-        if os.path.exists(self.ga_checkpoints_path):
-            shutil.rmtree(self.ga_checkpoints_path)
-        os.makedirs(self.ga_checkpoints_path)
+        store_path = os.path.join(self.output_path, 'logs/campaign_store')
+        if resume and os.path.isfile(os.path.join(store_path, 'index.json')):
+            self.store = CampaignStore.open(store_path, 'r+')
+        else:
+            self.store = CampaignStore.create(store_path, NPC_size, time_size)
+        self.store_run = 'global'
+        self.archive = GenerationArchive(NPC_size, time_size) # past generations, checkpoint files are only written
+        self.diversity = DiversityTracker(self.archive, diversity_sample_size, rng=self.rng) # None: exact similarity in progress.log
+
+        # fitness predictor trained on every simulated scenario, screens restart and mutation candidates
+        self.surrogate = None
+        self.restart_shortlist = 1
+        if surrogate_cfgs and surrogate_cfgs.get('enabled', False):
+            self.surrogate = Surrogate(NPC_size, time_size,
+                                       surrogate_cfgs.get('method', 'knn'),
+                                       surrogate_cfgs.get('k', 5),
+                                       surrogate_cfgs.get('alpha', 1.0),
+                                       surrogate_cfgs.get('exploration', 0.2),
+                                       surrogate_cfgs.get('min_samples', 20),
+                                       surrogate_cfgs.get('proposals', 4),
+                                       self.rng)
+            warm_start = list(surrogate_cfgs.get('warm_start', []))
+            if resume:
+                warm_start.append(os.path.join(self.output_path, 'simulation'))
+            self.surrogate.warm_start(warm_start)
+            self.restart_shortlist = surrogate_cfgs.get('restart_shortlist', 4)
+            runner.add_result_listener(self.surrogate.add_scenario)
+
+        # background LIS, None runs LIS in place and blocks the global search until it ends
+        self.lis_scheduler = None
+        if lis_cfgs and lis_cfgs.get('background', False):
+            self.lis_scheduler = LisScheduler(runner, lis_cfgs.get('max_concurrent', 1), lis_cfgs.get('simulator_share', 0.5))
 
         # TODO: add inner log
+        # ga.log and progress.log are views of the event log, rendered by its writer thread
+        self.events = open_log(os.path.join(self.output_path, 'logs'))
         self.ga_log = os.path.join(self.output_path, 'logs/ga.log')
-        if os.path.exists(self.ga_log):
+        if os.path.exists(self.ga_log) and not resume:
             os.remove(self.ga_log)
         
         self.progress_log = os.path.join(self.output_path, 'logs/progress.log')
-        if os.path.exists(self.progress_log):
+        if os.path.exists(self.progress_log) and not resume:
             os.remove(self.progress_log)
+
+        self.state_file = os.path.join(self.output_path, 'logs/ga_state.pkl')
     
-    def take_checkpoint(self, obj, ck_name):
-        ck_file = os.path.join(self.ga_checkpoints_path, ck_name)
-        with open(ck_file, 'wb') as ck_f:
-            pickle.dump(obj, ck_f)
+    def state(self):
+        # everything process() needs to continue, besides the archive which is rebuilt from the store
+        return {
+            'next_generation': self.next_generation,
+            'pop': self.pop,
+            'g_best': self.g_best,
+            'bests': self.bests,
+            'hasRestarted': self.hasRestarted,
+            'lastRestartGen': self.lastRestartGen,
+            'bestYAfterRestart': self.bestYAfterRestart,
+            'global_id': self.runner.global_id,
+            'random_state': random.getstate(),
+            'rng_state': self.rng.bit_generator.state
+        }
+
+    def save_state(self, next_generation):
+        """
+        Atomically replace logs/ga_state.pkl, a crash at any point leaves the previous state readable
+        """
+        self.next_generation = next_generation
+        with open(self.state_file + '.tmp', 'wb') as f:
+            pickle.dump(self.state(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    def restore(self):
+        """
+        Continue from logs/ga_state.pkl, returns False if there is none (the crash happened during init_pop).
+        Generations checkpointed after the state was saved are run again, the fitness cache spares their simulations.
+        """
+        if not os.path.isfile(self.state_file):
+            return False
+        with open(self.state_file, 'rb') as f:
+            state = pickle.load(f)
+
+        # latest segment of every finished generation, in generation order
+        segments = {}
+        for generation, start, end, _ in self.store.segment_rows(self.store_run):
+            if generation < state['next_generation']:
+                segments[generation] = (start, end)
+        for generation in sorted(segments):
+            self.archive.append(self.store.elements(*segments[generation]))
+            self.diversity.update()
+
+        self.restore_state(state)
+        logger.info('Resumed at generation ' + str(self.next_generation) + ' from ' + self.state_file + ', ' + str(len(self.archive)) + ' archived generations')
+        return True
+
+    def restore_state(self, state):
+        self.next_generation = state['next_generation']
+        self.pop = state['pop']
+        self.g_best = state['g_best']
+        self.bests = state['bests']
+        self.hasRestarted = state['hasRestarted']
+        self.lastRestartGen = state['lastRestartGen']
+        self.bestYAfterRestart = state['bestYAfterRestart']
+        # never behind the ids the runner already handed out after this state was saved
+        self.runner.global_id = max(self.runner.global_id, state['global_id'])
+        random.setstate(state['random_state'])
+        self.rng.bit_generator.state = state['rng_state']
+
+    def checkpoint(self, generation):
+        # Checkpoint this generation and the best scenario so far
+        self.store.append(self.pop, generation, self.store_run)
+        self.store.set_best(self.g_best, generation, self.store_run)
 
     def cross(self):
         # Implementation of random crossover
+        if self.population_backend == 'array':
+            pop_array = ArrayPopulation.from_corpus(self.pop)
+            touched = pop_array.cross(self.rng, self.pc)
+            pop_array.write_back(self.pop, touched)
+            self.touched_chs.extend(touched.tolist())
+            return
 
         for i in range(int(self.pop_size / 2.0)):
             # Check crossover probability
@@ -79,141 +190,78 @@ class GeneticMutator(object):
                 # select cross index
                 swap_index = random.randint(0, self.NPC_size - 1)
 
-                temp = copy.deepcopy(pop_j.scenario[swap_index])
-                pop_j.scenario[swap_index] = copy.deepcopy(pop_i.scenario[swap_index])
-                pop_i.scenario[swap_index] = temp
+                scenario_i = pop_i.own_scenario()
+                scenario_j = pop_j.own_scenario()
+                scenario_i[swap_index], scenario_j[swap_index] = scenario_j[swap_index], scenario_i[swap_index]
         # cross: generate new elements
 
     def mutation(self, ga_iter):
 
-        i = 0
-        while i < len(self.pop) :
-            eachChs = self.pop[i]
-            
-            if self.pm >= random.random():
-                
-                # select mutation index
-                npc_index = random.randint(0, self.NPC_size - 1)
-                time_index = random.randint(0, self.time_size - 1)
+        if self.population_backend == 'array':
+            pop_array = ArrayPopulation.from_corpus(self.pop)
+            touched = pop_array.mutate(self.rng, self.pm, self.bounds)
+            pop_array.write_back(self.pop, touched)
+            self.touched_chs.extend(touched.tolist())
+        else:
+            self.mutate_genes()
 
-                # Record which chromosomes have been touched
-                self.touched_chs.append(i)
-                actionIndex = random.randint(0, 1)
-                
-                if actionIndex == 0:
-                    # Change Speed
-                    eachChs.scenario[npc_index][time_index][0] = random.uniform(self.bounds[0][0], self.bounds[0][1])
-                elif actionIndex == 1:
-                    # Change direction
-                    eachChs.scenario[npc_index][time_index][1] = random.randrange(self.bounds[1][0], self.bounds[1][1])
-            
-            i = i + 1
         # Only run simulation for the chromosomes that are touched in this generation
         self.touched_chs = set(self.touched_chs)
         logger.info('Generate ' + str(len(self.touched_chs)) + ' mutated scenarios')
 
-        for i in self.touched_chs:
+        # 1. run simulator for all modified elements at once
+        touched_list = list(self.touched_chs)
+        parent_ids = [self.pop[i].scenario_id for i in touched_list] # ids before crossover and mutation
+        outputs = self.runner.run_batch([self.pop[i].scenario for i in touched_list], ga_iter, parent_ids)
+
+        for i, parent_id, (fitness, scenario_id) in zip(touched_list, parent_ids, outputs):
             eachChs = self.pop[i]
             before_fitness = eachChs.fitness
-            # TODO: fixed
-            # 1. run simulator for each modified elements
-            fitness, scenario_id = self.runner.run(eachChs.scenario)
             # 2. creat new elements or update fitness_score and coverage feat
             eachChs.fitness = fitness
             eachChs.scenario_id = scenario_id
+            eachChs.parent_id = parent_id
             after_fitness = eachChs.fitness
             
-            with open(self.ga_log, 'a') as f:
-                f.write('global_' + str(ga_iter))
-                f.write(',')
-                f.write(scenario_id)
-                f.write(',')
-                f.write('before run:' + str(before_fitness))
-                f.write(',')
-                f.write('after run:' + str(after_fitness))
-                f.write('\n')
+            self.events.emit('evaluated', name='global_' + str(ga_iter), scenario_id=scenario_id, before=before_fitness, after=after_fitness)
     
-    def select_roulette(self):
-
-        sum_f = 0
-        for i in range(0, self.pop_size):
-            if self.pop[i].fitness == 0:
-                self.pop[i].fitness = 0.001
-
-        ############################################################
-        min_fitness = self.pop[0].fitness
-        for k in range(0, self.pop_size):
-            if self.pop[k].fitness < min_fitness:
-                min_fitness = self.pop[k].fitness
-        if min_fitness < 0:
-            for l in range(0, self.pop_size):
-                self.pop[l].fitness = self.pop[l].fitness + (-1) * min_fitness
-
-        # roulette
-        for i in range(0, self.pop_size):
-            sum_f += self.pop[i].fitness
-        p = [0] * self.pop_size
-        for i in range(0, self.pop_size):
-            if sum_f == 0:
-                sum_f = 1
-            p[i] = self.pop[i].fitness / sum_f
-        q = [0] * self.pop_size
-        q[0] = 0
-        for i in range(0, self.pop_size):
-            s = 0
-            for j in range(0, i+1):
-                s += p[j]
-            q[i] = s
-
-        # start roulette
-        v = []
-        for i in range(0, self.pop_size):
-            r = random.random()
-            if r < q[0]:
-                v.append(copy.deepcopy(self.pop[0]))
-            for j in range(1, self.pop_size):
-                if q[j - 1] < r <= q[j]:
-                    v.append(copy.deepcopy(self.pop[j]))
-        self.pop = copy.deepcopy(v)
-
-    def select_top2(self):
-        maxFitness = 0
-        v = []
-        for i in range(0, self.pop_size):
-            if self.pop[i].fitness > maxFitness:
-                maxFitness = self.pop[i].fitness
-
-        for i in range(0, self.pop_size):
-            if self.pop[i].fitness == maxFitness:
-                for j in range(int(self.pop_size / 2.0)):
-                    v.append(copy.deepcopy(self.pop[i]))
-                break
-
-        max2Fitness = 0
-        for i in range(0, self.pop_size):
-            if self.pop[i].fitness > max2Fitness and self.pop[i].fitness != maxFitness:
-                max2Fitness = self.pop[i].fitness
-
-        for i in range(0, self.pop_size):
-            if self.pop[i].fitness == max2Fitness:
-                for j in range(int(self.pop_size / 2.0)):
-                    v.append(copy.deepcopy(self.pop[i]))
-                break
-
-        self.pop = copy.deepcopy(v)
+    def mutate_genes(self):
+        i = 0
+        while i < len(self.pop) :
+            eachChs = self.pop[i]
+            
+            if self.pm >= random.random():
+                
+                # select mutation index, the surrogate picks among a few random edits once it is trained
+                npc_index, time_index, actionIndex, value = tools.choose_gene_edit(eachChs.scenario, self.bounds, self.surrogate)
+
+                # Record which chromosomes have been touched
+                self.touched_chs.append(i)
+                # Change Speed (actionIndex 0) or direction (actionIndex 1)
+                eachChs.own_scenario()[npc_index][time_index][actionIndex] = value
+            
+            i = i + 1
+    
+    def select(self):
+        # indices of the next generation, genomes are shared until edited (copy on write)
+        fitness = [eachChs.fitness for eachChs in self.pop]
+        v = select_indices(fitness, self.pop_size, self.rng, self.selection)
+        self.pop = [self.pop[k].clone() for k in v]
 
     def find_best(self):
-        logger.debug(self.pop)
-        best = copy.deepcopy(self.pop[0]) # element object
         bestIndex = 0
         for i in range(self.pop_size):
-            if best.fitness < self.pop[i].fitness:
-                best = copy.deepcopy(self.pop[i])
+            if self.pop[bestIndex].fitness < self.pop[i].fitness:
                 bestIndex = i
-        return best, bestIndex
+        return self.pop[bestIndex], bestIndex # element object, clone it to keep it
     
     def init_pop(self):
-        for i in range(self.pop_size):
+        init_scenarios = []
+        if self.population_backend == 'array':
+            init_array = ArrayPopulation.random(self.rng, self.pop_size, self.NPC_size, self.time_size, self.bounds)
+            init_scenarios = [init_array.scenario(i) for i in range(self.pop_size)]
+
+        for i in range(len(init_scenarios), self.pop_size):
             # 1. init scenario data (data)
             scenario_data = [[[] for _ in range(self.time_size)] for _ in range(self.NPC_size)]
 
@@ -223,34 +271,35 @@ class GeneticMutator(object):
                     a = random.randrange(self.bounds[1][0], self.bounds[1][1]) # action
                     scenario_data[n_s][t_s].append(v)
                     scenario_data[n_s][t_s].append(a)
+            init_scenarios.append(scenario_data)
+
+        # 2. run simulator -> get outputs
+        outputs = self.runner.run_batch(init_scenarios, -1)
 
-            # 2. run simulator -> get outputs
-            fitness_score, scenario_id = self.runner.run(scenario_data)
+        for i in range(self.pop_size):
+            scenario_data = init_scenarios[i]
+            fitness_score, scenario_id = outputs[i]
             # 3. generate new elements
             new_element = CorpusElement(scenario_id, scenario_data, fitness_score)
             self.pop.append(new_element)
-            with open(self.ga_log, 'a') as f:
-                f.write('init_' + str(i))
-                f.write(',')
-                f.write(scenario_id)
-                f.write('\n')
+            self.events.emit('init', name='init_' + str(i), scenario_id=scenario_id)
     
     def process(self):
         
-        best, bestIndex = self.find_best()
-        self.g_best = copy.deepcopy(best)
+        if self.g_best is None: # not resumed
+            best, bestIndex = self.find_best()
+            self.g_best = best.clone()
 
-        with open(self.progress_log, 'a') as f:
-            f.write('name' + " " + "best_fitness" + " " + "global_best_fitness" + " " + "similarity" + " " + "datatime" + "\n")
-        
-        now = datetime.now()
-        date_time = now.strftime("%m-%d-%Y-%H-%M-%S")
-        with open(self.progress_log, 'a') as f:
-            f.write('initialization' + " " + str(best.fitness) + " " + str(self.g_best.fitness) + " " + "0000" + " " + date_time + "\n")
+            self.events.emit('progress_header')
+            
+            now = datetime.now()
+            date_time = now.strftime("%m-%d-%Y-%H-%M-%S")
+            self.events.emit('progress', name='initialization', best_fitness=best.fitness, global_best_fitness=self.g_best.fitness, similarity="0000", date_time=date_time)
+            self.save_state(0)
 
 
         # Start evolution
-        for i in range(self.max_gen):                       # i th generation.
+        for i in range(self.next_generation, self.max_gen):  # i th generation.
             # util.print_debug(" \n\n*** " + str(i) + "th generation ***")
             logger.info("    *** " + str(i) + "th generation ***    ")
             
@@ -259,15 +308,10 @@ class GeneticMutator(object):
             self.touched_chs = []
             self.cross()
             self.mutation(i)
-            if self.selection == 'top':
-                self.select_top2()
-            elif self.selection == 'roulette':
-                self.select_roulette()
-            else:
-                raise RuntimeError('Selection methods require: top or roulette.')      
+            self.select()
 
             best, bestIndex = self.find_best()                     # Find the scenario with the best fitness score in current generation 
-            self.bests[i] = best                        # Record the scenario with the best fitness score in i th generation
+            self.bests[i] = best.clone()                # Record the scenario with the best fitness score in i th generation
 
             ########### Update noprogressCounter #########
             noprogress = False
@@ -281,68 +325,98 @@ class GeneticMutator(object):
                     noprogress = True
 
             if self.g_best.fitness < best.fitness:                  # Record the best fitness score across all generations
-                self.g_best = copy.deepcopy(best)
+                self.g_best = best.clone()
 
-            N_generation = self.pop
-            N_b = self.g_best                           # Record the scenario with the best score over all generations
+            self.checkpoint(i)
 
-            # Update the checkpoint of the best scenario so far
-            self.take_checkpoint(N_b, 'best_scenario.obj')                       
-
-            # Checkpoint this generation
-            self.take_checkpoint(N_generation, 'last_gen.obj')
-
-            # Checkpoint every generation
             now = datetime.now()
             date_time = now.strftime("%m-%d-%Y-%H-%M-%S")
-            self.take_checkpoint(N_generation, 'generation-' + str(i) + '-at-' + date_time)
+            self.archive.append(self.pop)
+            similarity, similarity_error = self.diversity.update()
 
             #################### Start the Restart Process ################### 
             if noprogress:
                 logger.info("    ### Restart Based on Generation: " + str(i) + " ###    ")
-                oldCkName = self.ga_checkpoints_path
-                newPop = restart.generate_restart_scenarios(self.runner, self.ga_log, i, oldCkName, 1000, self.bounds)
-                self.pop = copy.deepcopy(newPop)
+                newPop = restart.generate_restart_scenarios(self.runner, self.ga_log, i, self.archive, 1000, self.bounds, self.surrogate, self.restart_shortlist)
+                self.pop = newPop
                 self.hasRestarted = True
                 best, self.bestIndex = self.find_best()
                 self.bestYAfterRestart = best.fitness
                 self.lastRestartGen = i
                  # Log fitness etc
-                with open(self.progress_log, 'a') as f:
-                    f.write('global_' + str(i) + '_restart' + " " + str(best.fitness) + " " + str(self.g_best.fitness) + " " + str(simiSum/float(self.pop_size)) + " " + date_time + "\n")
+                self.events.emit('progress', name='global_' + str(i) + '_restart', best_fitness=best.fitness, global_best_fitness=self.g_best.fitness, similarity=similarity, date_time=date_time)
 
             #################### End the Restart Process ################### 
 
-            if os.path.exists(self.ga_checkpoints_path) == True:
-                prePopPool = restart.get_all_checkpoints(self.ga_checkpoints_path) 
-                simiSum = 0
-                for eachChs in self.pop:
-                    eachSimilarity =  restart.get_similarity_scenario_vs_pre_pop(eachChs, prePopPool)
-                    simiSum += eachSimilarity
-                logger.debug(" ==== Similarity compared with all prior generations: " + str(simiSum/float(self.pop_size)))
+            if noprogress:
+                # the restarted population is not archived, compare it with the archive once
+                similarity, similarity_error = self.diversity.measure(tools.stack_scenarios(self.pop))
+            logger.debug(" ==== Similarity compared with all prior generations: " + str(similarity) + " (+/- " + str(similarity_error) + ")")
 
             # Log fitness etc
-            with open(self.progress_log, 'a') as f:
-                f.write('global_' + str(i) + " " + str(best.fitness) + " " + str(self.g_best.fitness) + " " + str(simiSum/float(self.pop_size)) + " " + date_time + "\n")
+            self.events.emit('progress', name='global_' + str(i), best_fitness=best.fitness, global_best_fitness=self.g_best.fitness, similarity=similarity, date_time=date_time)
 
             if best.fitness > self.bestYAfterRestart:
                 self.bestYAfterRestart = best.fitness
                 if i > (self.lastRestartGen + self.minLisGen): # Only allow one level of recursion
-                    ################## Start LIS #################
-                    logger.debug(" === Start of Local Iterative Search === ")
-                    # Increase mutation rate a little bit to jump out of local maxima
-                    local_output_path = os.path.join(self.output_path, 'local_ga', 'local_' + str(i))
-                    lis = LocalGeneticMutator(self.runner, self.selection, local_output_path, i, self.ga_log, self.progress_log, self.scenario_name, self.bounds, self.pm * 1.5, self.pc, self.pop_size, self.NPC_size, self.time_size, self.numOfGenInLis)
-                    lis.setLisPop(self.g_best)
-                    lisBestChs = lis.process(i)
-                    logger.debug(" --- Best fitness in LIS: " + str(lisBestChs.fitness))
-                    if lisBestChs.fitness > self.g_best.fitness:
-                        # Let's replace this
-                        self.pop[bestIndex] = copy.deepcopy(lisBestChs)
-                        logger.info(" --- Find better scenario in LIS: LIS->" + str(lisBestChs.fitness) + ", original->" + str(self.g_best.fitness))
-                    else:
-                        logger.debug(" --- LIS does not find any better scenarios")
-                    logger.info(' === End of Local Iterative Search === ')
+                    self.start_lis(i, i)
 
+            self.collect_lis()
+
+            if self.migration is not None:
+                self.migration.exchange(self, i)
+
+            self.save_state(i + 1)
+
+        self.collect_lis(wait=True)
         return self.g_best
+
+    def start_lis(self, name, generation):
+        """
+        Local Iterative Search around g_best, in the background when a LisScheduler is set
+        """
+        # Increase mutation rate a little bit to jump out of local maxima
+        local_output_path = os.path.join(self.output_path, 'local_ga', 'local_' + str(name))
+        if self.lis_scheduler is None:
+            logger.debug(" === Start of Local Iterative Search === ")
+            lis = LocalGeneticMutator(self.runner, self.selection, local_output_path, name, self.ga_log, self.progress_log, self.scenario_name, self.bounds, self.pm * 1.5, self.pc, self.pop_size, self.NPC_size, self.time_size, self.numOfGenInLis, self.rng, self.surrogate, self.store)
+            lis.setLisPop(self.g_best)
+            self.merge_lis(lis.process(generation))
+            logger.info(' === End of Local Iterative Search === ')
+            return
+
+        if not self.lis_scheduler.can_launch():
+            logger.debug(" --- Skip LIS " + str(name) + ", " + str(self.lis_scheduler.max_concurrent) + " already running")
+            return
+        # own generators for crossover, mutation, selection and surrogate picks, neither the random module
+        # nor self.rng are shared with the LIS thread
+        lis_seed = int(self.rng.integers(2 ** 32))
+        lis_rng = np.random.default_rng(lis_seed)
+        lis_random = random.Random(lis_seed)
+        lis = LocalGeneticMutator(self.lis_scheduler.runner, self.selection, local_output_path, name, self.ga_log, self.progress_log, self.scenario_name, self.bounds, self.pm * 1.5, self.pc, self.pop_size, self.NPC_size, self.time_size, self.numOfGenInLis, lis_rng, self.surrogate, self.store, lis_random)
+        self.lis_scheduler.launch(name, lis, self.g_best.clone(), generation)
+
+    def collect_lis(self, wait=False):
+        if self.lis_scheduler is None:
+            return
+        for name, lisBestChs in self.lis_scheduler.finished(wait):
+            logger.info(' === End of background Local Iterative Search ' + str(name) + ' === ')
+            self.merge_lis(lisBestChs)
+        if wait:
+            self.lis_scheduler.shutdown()
+
+    def merge_lis(self, lisBestChs):
+        """
+        A LIS result replaces the best individual of the population if it beats g_best, returns its slot or None
+        """
+        logger.debug(" --- Best fitness in LIS: " + str(lisBestChs.fitness))
+        if lisBestChs.fitness <= self.g_best.fitness:
+            logger.debug(" --- LIS does not find any better scenarios")
+            return None
+        # Let's replace this
+        best, bestIndex = self.find_best()
+        self.pop[bestIndex] = lisBestChs.clone()
+        logger.info(" --- Find better scenario in LIS: LIS->" + str(lisBestChs.fitness) + ", original->" + str(self.g_best.fitness))
+        self.g_best = lisBestChs.clone()
+        return bestIndex
  
\ No newline at end of file
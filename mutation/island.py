@@ -0,0 +1,105 @@
+import os
+import queue
+import random
+
+from datetime import datetime
+
+from corpus.corpus import CorpusElement
+
+TOPOLOGIES = ('ring', 'all', 'random')
+
+def neighbours(island_id, island_num, topology):
+    """
+    Islands that receive the migrants of island_id
+    """
+    others = [k for k in range(island_num) if k != island_id]
+    if topology not in TOPOLOGIES:
+        raise RuntimeError('Migration topologies require: ' + ', '.join(TOPOLOGIES) + '.')
+    if len(others) == 0:
+        return []
+    if topology == 'ring':
+        return [(island_id + 1) % island_num]
+    elif topology == 'all':
+        return others
+    return [random.choice(others)]
+
+class Migration(object):
+    """
+    Migration endpoint of one island, passed to its process and set as GeneticMutator.migration.
+    Every interval generations the island sends copies of its migrants best individuals to its neighbours
+    and takes in whatever arrived in its inbox since the last exchange, so islands never wait for each other.
+    An immigrant replaces the worst individual if it is fitter.
+    Improvements of the island's global best are reported on the events queue as ('best', island_id, element).
+    """
+
+    def __init__(self, island_id, inboxes, events, topology='ring', interval=5, migrants=1):
+        self.island_id = island_id
+        self.inboxes = inboxes
+        self.events = events
+        self.topology = topology
+        self.interval = interval
+        self.migrants = migrants
+        self.reported_fitness = None
+
+    def exchange(self, ga, generation):
+        if ga.g_best is not None and (self.reported_fitness is None or ga.g_best.fitness > self.reported_fitness):
+            self.reported_fitness = ga.g_best.fitness
+            self.events.put(('best', self.island_id, self.emigrant(ga.g_best)))
+
+        if (generation + 1) % self.interval != 0:
+            return
+
+        ranked = sorted(range(len(ga.pop)), key=lambda k: ga.pop[k].fitness, reverse=True)
+        for target in neighbours(self.island_id, len(self.inboxes), self.topology):
+            for k in ranked[:self.migrants]:
+                self.inboxes[target].put(self.emigrant(ga.pop[k]))
+
+        immigrants = []
+        while True:
+            try:
+                immigrants.append(self.inboxes[self.island_id].get_nowait())
+            except queue.Empty:
+                break
+
+        for immigrant in immigrants:
+            worst = min(range(len(ga.pop)), key=lambda k: ga.pop[k].fitness)
+            if immigrant.fitness > ga.pop[worst].fitness:
+                ga.pop[worst] = immigrant
+            if immigrant.fitness > ga.g_best.fitness:
+                ga.g_best = immigrant.clone()
+
+        ga.events.emit('migration', name='migration_' + str(generation), sent=min(self.migrants, len(ranked)), received=len(immigrants))
+
+    def emigrant(self, element):
+        # without parent chain, scenario id tagged with the island it was simulated on
+        scenario_id = element.scenario_id
+        if not str(scenario_id).startswith('island_'):
+            scenario_id = 'island_' + str(self.island_id) + '/' + str(scenario_id)
+        return CorpusElement(scenario_id, [[list(gene) for gene in npc] for npc in element.scenario], element.fitness)
+
+def merge_progress_logs(island_logs, merged_log):
+    """
+    Interleave the progress.log of every island by time, names prefixed with island_<k>_
+    """
+    lines = []
+    header = None
+    for island_id, island_log in enumerate(island_logs):
+        if not os.path.isfile(island_log):
+            continue
+        with open(island_log, 'r') as f:
+            for order, line in enumerate(f.read().splitlines()):
+                items = line.split(' ')
+                if items[0] == 'name':
+                    header = line
+                    continue
+                try:
+                    time = datetime.strptime(items[-1], "%m-%d-%Y-%H-%M-%S")
+                except ValueError:
+                    continue
+                lines.append((time, island_id, order, 'island_' + str(island_id) + '_' + line))
+
+    with open(merged_log, 'w') as f:
+        if header is not None:
+            f.write(header + "\n")
+        for line in sorted(lines):
+            f.write(line[3] + "\n")
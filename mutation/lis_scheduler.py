@@ -0,0 +1,78 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+class ThrottledRunner(object):
+    """
+    Runner front end that keeps at most max_in_flight of its scenarios on the simulator pool at once
+    """
+
+    def __init__(self, runner, max_in_flight):
+        self.runner = runner
+        self.max_in_flight = max_in_flight
+        self._slots = threading.Semaphore(max_in_flight)
+
+    def submit(self, scenario_data, generation=None, parent_id=None):
+        self._slots.acquire()
+        try:
+            future = self.runner.submit(scenario_data, generation, parent_id)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        return future
+
+    def run(self, scenario_data, generation=None, parent_id=None):
+        return self.submit(scenario_data, generation, parent_id).result()
+
+    def run_batch(self, scenario_list, generation=None, parent_ids=None):
+        if parent_ids is None:
+            parent_ids = [None] * len(scenario_list)
+        futures = [self.submit(scenario_data, generation, parent_id) for scenario_data, parent_id in zip(scenario_list, parent_ids)]
+        return [future.result() for future in futures]
+
+class LisScheduler(object):
+    """
+    Runs Local Iterative Searches in background threads while the global GA keeps evolving.
+        max_concurrent: LIS instances running at once, further triggers are skipped
+        simulator_share: fraction of the simulators all LIS instances together may keep busy (at least one)
+    """
+
+    def __init__(self, runner, max_concurrent=1, simulator_share=0.5):
+        self.max_concurrent = max_concurrent
+        self.runner = ThrottledRunner(runner, max(1, int(runner.pool.size * simulator_share)))
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='lis')
+        self._running = {} # name -> future of the LIS best element
+
+    def can_launch(self):
+        return len(self._running) < self.max_concurrent
+
+    def launch(self, name, lis, seed, generation):
+        """
+        lis: LocalGeneticMutator on self.runner, seed: element the local population is built from
+        """
+        logger.info(' === Start of background Local Iterative Search ' + str(name) + ' (' + str(len(self._running) + 1) + ' running) === ')
+        self._running[name] = self._executor.submit(self._run, lis, seed, generation)
+
+    def _run(self, lis, seed, generation):
+        lis.setLisPop(seed)
+        return lis.process(generation)
+
+    def finished(self, wait=False):
+        """
+        [(name, best element)] of the LIS runs that ended since the last call, all of them if wait
+        """
+        results = []
+        for name, future in list(self._running.items()):
+            if not wait and not future.done():
+                continue
+            del self._running[name]
+            try:
+                results.append((name, future.result()))
+            except Exception as e:
+                logger.error('Local Iterative Search ' + str(name) + ' failed: ' + str(e))
+        return results
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -1,16 +1,23 @@
 import os
-import copy
 import random
-import pickle
-import shutil
+import numpy as np
 
 from datetime import datetime
 from loguru import logger
-from mutation import restart
+from corpus.store import CampaignStore
+from corpus.events import open_log
+from mutation import tools
+from mutation.archive import GenerationArchive
+from mutation.diversity import DiversityTracker
+from mutation.selection import parse_selection, select_indices
 
 class LocalGeneticMutator(object):
-    def __init__(self, runner, selection, output_path, global_iter, ga_logger, progress_logger, scenario_name, bounds, pm, pc, pop_size, NPC_size, time_size, max_gen):
+    def __init__(self, runner, selection, output_path, global_iter, ga_logger, progress_logger, scenario_name, bounds, pm, pc, pop_size, NPC_size, time_size, max_gen, rng=None, surrogate=None, store=None, rand=None):
         self.pop = []
+        # shared with the global GA to keep a seeded run reproducible, a background LIS gets its own
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.random = rand if rand is not None else random
+        self.surrogate = surrogate          # shared with the global GA, picks mutations once trained
         self.bounds = bounds                # The value ranges of the inner most elements
         self.pm = pm
         self.pc = pc
@@ -30,49 +37,51 @@ class LocalGeneticMutator(object):
         self.bestYAfterRestart = 0
 
         self.runner = runner
-        self.selection = selection
+        self.selection = parse_selection(selection)
         self.scenario_name = scenario_name
         self.output_path = output_path
-        self.ga_checkpoints_path = os.path.join(self.output_path, 'logs/checkpoints_ga')
-
-        if os.path.exists(self.ga_checkpoints_path):
-            shutil.rmtree(self.ga_checkpoints_path)
-        os.makedirs(self.ga_checkpoints_path)
+        self.store = store if store is not None else CampaignStore.create(os.path.join(self.output_path, 'logs/campaign_store'), NPC_size, time_size)
+        self.store_run = 'local_' + str(global_iter)
+        self.archive = GenerationArchive(NPC_size, time_size) # past generations, checkpoint files are only written
+        self.diversity = DiversityTracker(self.archive, rng=self.rng)
         
         # TODO: add inner log
         self.ga_log = ga_logger
         self.progress_log = progress_logger
+        self.events = open_log(os.path.dirname(ga_logger)) # event log of the global GA, ga_logger is its ga.log view
         self.global_iter = global_iter
+        self.global_generation = None       # generation of the global GA this LIS started from, set by process
 
     
-    def take_checkpoint(self, obj, ck_name):
-        ck_file = os.path.join(self.ga_checkpoints_path, ck_name)
-        with open(ck_file, 'wb') as ck_f:
-            pickle.dump(obj, ck_f)
+    def checkpoint(self, generation):
+        # Checkpoint this generation and the best scenario so far
+        self.store.append(self.pop, generation, self.store_run)
+        self.store.set_best(self.g_best, generation, self.store_run)
 
     def setLisPop(self, singleChs):
         for i in range(self.pop_size):
-            self.pop.append(copy.deepcopy(singleChs))
+            self.pop.append(singleChs.clone())
 
         # Add some entropy
         tempPm = self.pm
         self.pm = 1
         self.mutation(0)
         self.pm = tempPm
-        self.g_best, bestIndex = self.find_best()
+        best, bestIndex = self.find_best()
+        self.g_best = best.clone()
 
     def cross(self):
         # Implementation of random crossover
 
         for i in range(int(self.pop_size / 2.0)):
             # Check crossover probability
-            if self.pc > random.random():
+            if self.pc > self.random.random():
             # randomly select 2 chromosomes(scenarios) in pops
                 i = 0
                 j = 0
                 while i == j:
-                    i = random.randint(0, self.pop_size-1)
-                    j = random.randint(0, self.pop_size-1)
+                    i = self.random.randint(0, self.pop_size-1)
+                    j = self.random.randint(0, self.pop_size-1)
                 pop_i = self.pop[i]
                 pop_j = self.pop[j]
 
@@ -82,11 +91,11 @@ class LocalGeneticMutator(object):
 
                 # Every time we only switch one NPC between scenarios
                 # select cross index
-                swap_index = random.randint(0, self.NPC_size - 1)
+                swap_index = self.random.randint(0, self.NPC_size - 1)
 
-                temp = copy.deepcopy(pop_j.scenario[swap_index])
-                pop_j.scenario[swap_index] = copy.deepcopy(pop_i.scenario[swap_index])
-                pop_i.scenario[swap_index] = temp
+                scenario_i = pop_i.own_scenario()
+                scenario_j = pop_j.own_scenario()
+                scenario_i[swap_index], scenario_j[swap_index] = scenario_j[swap_index], scenario_i[swap_index]
         # cross: generate new elements
 
     def mutation(self, ga_iter):
@@ -95,129 +104,53 @@ class LocalGeneticMutator(object):
         while i < len(self.pop) :
             eachChs = self.pop[i]
             
-            if self.pm >= random.random():
+            if self.pm >= self.random.random():
                 
-                beforeMutation = copy.deepcopy(eachChs)
-                # select mutation index
-                npc_index = random.randint(0, self.NPC_size - 1)
-                time_index = random.randint(0, self.time_size - 1)
+                # select mutation index, the surrogate picks among a few random edits once it is trained
+                npc_index, time_index, actionIndex, value = tools.choose_gene_edit(eachChs.scenario, self.bounds, self.surrogate, self.random, self.rng)
 
                 # Record which chromosomes have been touched
                 self.touched_chs.append(i)
-                actionIndex = random.randint(0, 1)
-                
-                if actionIndex == 0:
-                    # Change Speed
-                    eachChs.scenario[npc_index][time_index][0] = random.uniform(self.bounds[0][0], self.bounds[0][1])
-                elif actionIndex == 1:
-                    # Change direction
-                    eachChs.scenario[npc_index][time_index][1] = random.randrange(self.bounds[1][0], self.bounds[1][1])
+                # Change Speed (actionIndex 0) or direction (actionIndex 1)
+                eachChs.own_scenario()[npc_index][time_index][actionIndex] = value
             i += 1
         
         logger.info('Generate ' + str(len(self.touched_chs)) + ' mutated scenarios')
         # Only run simulation for the chromosomes that are touched in this generation
         self.touched_chs = set(self.touched_chs)
-        for i in self.touched_chs:
-            before_fitness = eachChs.fitness
+        touched_list = list(self.touched_chs)
+        parent_ids = [self.pop[i].scenario_id for i in touched_list] # ids before crossover and mutation
+        outputs = self.runner.run_batch([self.pop[i].scenario for i in touched_list], self.global_generation, parent_ids)
+
+        for i, parent_id, (fitness, scenario_id) in zip(touched_list, parent_ids, outputs):
             eachChs = self.pop[i]
-            fitness, scenario_id = self.runner.run(eachChs.scenario)
+            before_fitness = eachChs.fitness
             # 2. creat new elements or update fitness_score and coverage feat
             eachChs.fitness = fitness
             eachChs.scenario_id = scenario_id
+            eachChs.parent_id = parent_id
             after_fitness = eachChs.fitness
 
-            with open(self.ga_log, 'a') as f:
-                f.write('global_' + str(self.global_iter) + '_local_' + str(ga_iter))
-                f.write(',')
-                f.write(scenario_id)
-                f.write(',')
-                f.write('before run:' + str(before_fitness))
-                f.write(',')
-                f.write('after run:' + str(after_fitness))
-                f.write('\n')
+            self.events.emit('evaluated', name='global_' + str(self.global_iter) + '_local_' + str(ga_iter), scenario_id=scenario_id, before=before_fitness, after=after_fitness)
     
-    def select_roulette(self):
-
-        sum_f = 0
-        for i in range(0, self.pop_size):
-            if self.pop[i].fitness == 0:
-                self.pop[i].fitness = 0.001
-
-        ############################################################
-        min_fitness = self.pop[0].fitness
-        for k in range(0, self.pop_size):
-            if self.pop[k].fitness < min_fitness:
-                min_fitness = self.pop[k].fitness
-        if min_fitness < 0:
-            for l in range(0, self.pop_size):
-                self.pop[l].fitness = self.pop[l].fitness + (-1) * min_fitness
-
-        # roulette
-        for i in range(0, self.pop_size):
-            sum_f += self.pop[i].fitness
-        p = [0] * self.pop_size
-        for i in range(0, self.pop_size):
-            if sum_f == 0:
-                sum_f = 1
-            p[i] = self.pop[i].fitness / sum_f
-        q = [0] * self.pop_size
-        q[0] = 0
-        for i in range(0, self.pop_size):
-            s = 0
-            for j in range(0, i+1):
-                s += p[j]
-            q[i] = s
-
-        # start roulette
-        v = []
-        for i in range(0, self.pop_size):
-            r = random.random()
-            if r < q[0]:
-                v.append(copy.deepcopy(self.pop[0]))
-            for j in range(1, self.pop_size):
-                if q[j - 1] < r <= q[j]:
-                    v.append(copy.deepcopy(self.pop[j]))
-        self.pop = copy.deepcopy(v)
-
-    def select_top2(self):
-        maxFitness = 0
-        v = []
-        for i in range(0, self.pop_size):
-            if self.pop[i].fitness > maxFitness:
-                maxFitness = self.pop[i].fitness
-
-        for i in range(0, self.pop_size):
-            if self.pop[i].fitness == maxFitness:
-                for j in range(int(self.pop_size / 2.0)):
-                    v.append(copy.deepcopy(self.pop[i]))
-                break
-
-        max2Fitness = 0
-        for i in range(0, self.pop_size):
-            if self.pop[i].fitness > max2Fitness and self.pop[i].fitness != maxFitness:
-                max2Fitness = self.pop[i].fitness
-
-        for i in range(0, self.pop_size):
-            if self.pop[i].fitness == max2Fitness:
-                for j in range(int(self.pop_size / 2.0)):
-                    v.append(copy.deepcopy(self.pop[i]))
-                break
-
-        self.pop = copy.deepcopy(v)
+    def select(self):
+        # indices of the next generation, genomes are shared until edited (copy on write)
+        fitness = [eachChs.fitness for eachChs in self.pop]
+        v = select_indices(fitness, self.pop_size, self.rng, self.selection)
+        self.pop = [self.pop[k].clone() for k in v]
 
     def find_best(self):
-        best = copy.deepcopy(self.pop[0]) # element object
         bestIndex = 0
         for i in range(self.pop_size):
-            if best.fitness < self.pop[i].fitness:
-                best = copy.deepcopy(self.pop[i])
+            if self.pop[bestIndex].fitness < self.pop[i].fitness:
                 bestIndex = i
-        return best, bestIndex
+        return self.pop[bestIndex], bestIndex # element object, clone it to keep it
     
     def process(self, global_generation_id):
         
+        self.global_generation = global_generation_id
         best, bestIndex = self.find_best()
-        self.g_best = copy.deepcopy(best)
+        self.g_best = best.clone()
 
         # Start evolution
         for i in range(self.max_gen):                       # i th generation.
@@ -228,44 +161,24 @@ class LocalGeneticMutator(object):
             self.touched_chs = []
             self.cross()
             self.mutation(i)
-            if self.selection == 'top':
-                self.select_top2()
-            elif self.selection == 'roulette':
-                self.select_roulette()
-            else:
-                raise RuntimeError('Selection methods require: top or roulette.')      
+            self.select()
 
             best, bestIndex = self.find_best()                     # Find the scenario with the best fitness score in current generation 
-            self.bests[i] = best                        # Record the scenario with the best fitness score in i th generation
+            self.bests[i] = best.clone()                # Record the scenario with the best fitness score in i th generation
 
             if self.g_best.fitness < best.fitness:                  # Record the best fitness score across all generations
-                self.g_best = copy.deepcopy(best)
-
-            N_generation = self.pop
-            N_b = self.g_best                           # Record the scenario with the best score over all generations
+                self.g_best = best.clone()
 
-            # Update the checkpoint of the best scenario so far
-            self.take_checkpoint(N_b, 'best_scenario.obj')                       
+            self.checkpoint(i)
 
-            # Checkpoint this generation
-            self.take_checkpoint(N_generation, 'last_gen.obj')
-
-            # Checkpoint every generation
             now = datetime.now()
             date_time = now.strftime("%m-%d-%Y-%H-%M-%S")
-            self.take_checkpoint(N_generation, 'generation-' + str(i) + '-at-' + date_time)
-
-            if os.path.exists(self.ga_checkpoints_path) == True:
-                prePopPool = restart.get_all_checkpoints(self.ga_checkpoints_path) 
-                simiSum = 0
-                for eachChs in self.pop:
-                    eachSimilarity =  restart.get_similarity_scenario_vs_pre_pop(eachChs, prePopPool)
-                    simiSum += eachSimilarity
-                # util.print_debug(" ==== Similarity compared with all prior generations: " + str(simiSum/float(self.pop_size)))
+            self.archive.append(self.pop)
+            similarity, _ = self.diversity.update()
+            # util.print_debug(" ==== Similarity compared with all prior generations: " + str(similarity))
 
             # Log fitness etc
-            with open(self.progress_log, 'a') as f:
-                f.write('global_' + str(self.global_iter) + '_local_' + str(i) + " " + str(best.fitness) + " " + str(self.g_best.fitness) + " " + str(simiSum/float(self.pop_size)) + " " + date_time + "\n")
+            self.events.emit('progress', name='global_' + str(self.global_iter) + '_local_' + str(i), best_fitness=best.fitness, global_best_fitness=self.g_best.fitness, similarity=similarity, date_time=date_time)
 
         return self.g_best
  
\ No newline at end of file
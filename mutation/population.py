@@ -0,0 +1,96 @@
+import numpy as np
+
+from corpus.corpus import CorpusElement
+
+def scenario_to_genome(scenario):
+    """
+    nested list scenario[npc][time] = [v, a] -> (npc_size, time_size, 2) float array
+    """
+    return np.asarray(scenario, dtype=float)
+
+def genome_to_scenario(genome):
+    """
+    (npc_size, time_size, 2) array -> nested list scenario[npc][time] = [v, a], as used by Runner.run
+    """
+    return [[[v, int(a)] for v, a in npc] for npc in genome.tolist()]
+
+class ArrayPopulation(object):
+    """
+    Population stored as arrays:
+        genomes: (pop_size, npc_size, time_size, 2), [..., 0] velocity and [..., 1] action
+        fitness: (pop_size,)
+        scenario_ids: (pop_size,) object
+    All operators draw from a numpy Generator, so a seeded Generator reproduces a run.
+    """
+
+    def __init__(self, genomes, fitness=None, scenario_ids=None):
+        self.genomes = genomes
+        self.pop_size = genomes.shape[0]
+        self.fitness = np.zeros(self.pop_size) if fitness is None else np.asarray(fitness, dtype=float)
+        self.scenario_ids = np.empty(self.pop_size, dtype=object) if scenario_ids is None else np.asarray(scenario_ids, dtype=object)
+
+    @classmethod
+    def random(cls, rng, pop_size, npc_size, time_size, bounds):
+        genomes = np.empty((pop_size, npc_size, time_size, 2))
+        genomes[..., 0] = rng.uniform(bounds[0][0], bounds[0][1], size=(pop_size, npc_size, time_size)) # velocity
+        genomes[..., 1] = rng.integers(bounds[1][0], bounds[1][1], size=(pop_size, npc_size, time_size)) # action
+        return cls(genomes)
+
+    @classmethod
+    def from_corpus(cls, pop):
+        """
+        list of CorpusElement (e.g. a loaded generation checkpoint) -> ArrayPopulation
+        """
+        genomes = np.asarray([element.scenario for element in pop], dtype=float)
+        fitness = [element.fitness if element.fitness is not None else 0.0 for element in pop]
+        scenario_ids = [element.scenario_id for element in pop]
+        return cls(genomes, fitness, scenario_ids)
+
+    def to_corpus(self):
+        return [CorpusElement(self.scenario_ids[i], genome_to_scenario(self.genomes[i]), float(self.fitness[i])) for i in range(self.pop_size)]
+
+    def scenario(self, i):
+        return genome_to_scenario(self.genomes[i])
+
+    def write_back(self, pop, indices):
+        """
+        Copy the genomes of the given individuals into the nested-list scenarios of pop
+        """
+        for i in indices:
+            pop[i].set_scenario(genome_to_scenario(self.genomes[i]))
+
+    def cross(self, rng, pc):
+        """
+        Pair individuals at random (disjoint pairs), each pair swaps one random NPC with probability pc.
+        Returns the touched indices.
+        """
+        npc_size = self.genomes.shape[1]
+        perm = rng.permutation(self.pop_size)
+        pair_num = self.pop_size // 2
+        first = perm[0:2 * pair_num:2]
+        second = perm[1:2 * pair_num:2]
+        active = rng.random(pair_num) < pc
+        first = first[active]
+        second = second[active]
+        swap_index = rng.integers(0, npc_size, size=len(first))
+
+        temp = self.genomes[first, swap_index].copy()
+        self.genomes[first, swap_index] = self.genomes[second, swap_index]
+        self.genomes[second, swap_index] = temp
+        return np.concatenate([first, second])
+
+    def mutate(self, rng, pm, bounds):
+        """
+        Each individual is mutated with probability pm: one random (npc, time) gets a new velocity or action.
+        Returns the touched indices.
+        """
+        npc_size, time_size = self.genomes.shape[1], self.genomes.shape[2]
+        touched = np.nonzero(rng.random(self.pop_size) <= pm)[0]
+        npc_index = rng.integers(0, npc_size, size=len(touched))
+        time_index = rng.integers(0, time_size, size=len(touched))
+        action_index = rng.integers(0, 2, size=len(touched))
+
+        new_speed = rng.uniform(bounds[0][0], bounds[0][1], size=len(touched))
+        new_action = rng.integers(bounds[1][0], bounds[1][1], size=len(touched))
+        self.genomes[touched, npc_index, time_index, action_index] = np.where(action_index == 0, new_speed, new_action)
+        return touched
@@ -5,18 +5,20 @@ import pickle
 import random
 
 from corpus.corpus import CorpusElement
+from corpus.events import open_log
 from mutation import tools
+from mutation.archive import GenerationArchive
 
 def get_all_checkpoints(ck_path):
-    # ga_checkpoints_path
+    # logs/checkpoints_ga exported by corpus.store, for offline analysis: a running GA queries its GenerationArchive instead
     only_files = os.listdir(ck_path)
 
     pre_pop_pool = []
 
     for i in range(len(only_files)):
+        if "generation" not in only_files[i]:
+            continue
         with open(ck_path+'/'+only_files[i], "rb") as f:
-            if "generation" not in only_files[i]:
-                continue
             try:
                 pre_pop = pickle.load(f)
                 pre_pop_pool.append(pre_pop)
@@ -25,17 +27,13 @@ def get_all_checkpoints(ck_path):
 
     return pre_pop_pool
 
-def generate_restart_scenarios(runner, ga_logger, global_iter, ck_path, scenario_num, bounds):
-	
-	pre_pop_pool = get_all_checkpoints(ck_path)			 
+def generate_restart_scenarios(runner, ga_logger, global_iter, archive, scenario_num, bounds, surrogate=None, shortlist=4):
 	
 	new_pop_candidate = []
 	new_scenario_list = []
-	pop_size = len(pre_pop_pool[0])
-	npc_size = len(pre_pop_pool[0][0].scenario)
-	time_size = len(pre_pop_pool[0][0].scenario[0])
-	scenario_size = len(pre_pop_pool[0])
-	pop_pool_size = len(pre_pop_pool)
+	pop_size = int(archive.pop_sizes[0])
+	npc_size = archive.genomes.shape[1]
+	time_size = archive.genomes.shape[2]
 	scenario_dict = {}
 
 	for i in range(scenario_num):
@@ -51,61 +49,47 @@ def generate_restart_scenarios(runner, ga_logger, global_iter, ck_path, scenario
 
 		new_pop_candidate.append(scenario_data)
 
-	# Go through every scenario
-
+	# Similarity of every candidate with all prior generations
+	similarities = archive.similarity(tools.stack_scenarios(new_pop_candidate))
 	for i in range(scenario_num):
-		similarity = 0
-		for j in range(pop_pool_size):
-			simi_pop = 0
-			for k in range(scenario_size):
-				# TODO
-				scenario1 = new_pop_candidate[i]
-				scenario2 = pre_pop_pool[j][k].scenario
-				simi = tools.get_similarity_between_scenarios(scenario1, scenario2)
-				simi_pop += simi
-
-			simi_pop /= scenario_size + 0.0
-			similarity += simi_pop
-		similarity /= pop_pool_size + 0.0
-		scenario_dict[i] = similarity
+		scenario_dict[i] = similarities[i]
 
 	sorted_x = sorted(scenario_dict.items(), key=lambda kv: kv[1], reverse=True)
 	sorted_dict = collections.OrderedDict(sorted_x)
 
 	index = sorted_dict.keys()
 
-	j = 0
+	selected_index = list(index)[:pop_size]
+
+	# the surrogate picks pop_size of the shortlist * pop_size most diverse candidates
+	if surrogate is not None and surrogate.ready:
+		shortlist_index = list(index)[:shortlist * pop_size]
+		picked = surrogate.select(tools.stack_scenarios([new_pop_candidate[i] for i in shortlist_index]), pop_size)
+		selected_index = [shortlist_index[k] for k in picked]
 
-	for i in index:
-		if j == pop_size:
-			break
-		# run pop
-		fitness, scenario_id = runner.run(new_pop_candidate[i])
+	# run pop
+	outputs = runner.run_batch([new_pop_candidate[i] for i in selected_index], global_iter)
 
+	events = open_log(os.path.dirname(ga_logger)) # ga_logger is the ga.log view of the event log
+	j = 0
+
+	for i, (fitness, scenario_id) in zip(selected_index, outputs):
 		new_element = CorpusElement(scenario_id, new_pop_candidate[i], fitness)
 
 		new_scenario_list.append(new_element)
 		
-		with open(ga_logger, 'a') as f:
-			f.write('global_' + str(global_iter) + '_restart_' + str(j))
-			f.write(',')
-			f.write(scenario_id)
-			f.write('\n')
+		events.emit('restart', name='global_' + str(global_iter) + '_restart_' + str(j), scenario_id=scenario_id)
 		
 		j += 1
 
 	return new_scenario_list
 
+def get_similarity_vs_pre_pop(genomes, pre_pop_pool, chunk_size=256):
+	"""
+	(n, npc_size, time_size, 2) genomes -> (n,) mean similarity with each prior generation, averaged over generations
+	"""
+	return GenerationArchive.from_pool(pre_pop_pool).similarity(genomes, chunk_size)
+
 def get_similarity_scenario_vs_pre_pop(scenario, pre_pop_pool):
 	
-	similarity = 0
-	for i in pre_pop_pool:
-		pop_similarity = 0
-		for j in i:
-			simi = tools.get_similarity_between_scenarios(j.scenario, scenario.scenario)
-			pop_similarity += simi
-		pop_similarity /= len(i)
-		similarity += pop_similarity + 0.0
-	similarity /= len(pre_pop_pool) + 0.0
-
-	return similarity	
\ No newline at end of file
+	return float(get_similarity_vs_pre_pop(tools.stack_scenarios([scenario]), pre_pop_pool)[0])
@@ -0,0 +1,121 @@
+import numpy as np
+
+METHODS = ('top', 'roulette', 'sus', 'tournament', 'rank')
+
+def parse_selection(selection):
+    """
+    selection config -> dict of selection parameters
+        roulette                                  a method name
+        {method: tournament, elitism: 1, ...}     a method with parameters
+    parameters:
+        elitism: number of best individuals copied to the next generation before selecting the rest
+        tournament_size: individuals drawn per tournament
+        rank_pressure: selective pressure of linear rank selection, in [1, 2]
+    """
+    params = {'method': selection} if isinstance(selection, str) else dict(selection)
+    params.setdefault('elitism', 0)
+    params.setdefault('tournament_size', 2)
+    params.setdefault('rank_pressure', 1.5)
+    if params.get('method') not in METHODS:
+        raise RuntimeError('Selection methods require: ' + ', '.join(METHODS) + '.')
+    return params
+
+def roulette_weights(fitness):
+    """
+    Non-negative selection weights of the roulette wheel, raw fitness is left unchanged:
+    zero fitness counts as 0.001 and negative fitness is shifted by the minimum
+    """
+    weights = np.asarray(fitness, dtype=float).copy()
+    weights[weights == 0] = 0.001
+    min_weight = weights.min()
+    if min_weight < 0:
+        weights -= min_weight
+    return weights
+
+def _wheel(weights):
+    cumulative = np.cumsum(weights)
+    total = cumulative[-1]
+    if total <= 0:
+        cumulative = np.arange(1, len(weights) + 1, dtype=float)
+        total = cumulative[-1]
+    return cumulative, total
+
+def select_roulette(fitness, n, rng):
+    """
+    n independent spins of the fitness proportional wheel, O(n log n)
+    """
+    cumulative, total = _wheel(roulette_weights(fitness))
+    indices = np.searchsorted(cumulative, rng.random(n) * total, side='right')
+    return np.minimum(indices, len(cumulative) - 1)
+
+def select_sus(fitness, n, rng):
+    """
+    Stochastic universal sampling: n equally spaced pointers with one random offset on the same wheel
+    """
+    if n == 0:
+        return np.empty(0, dtype=int)
+    cumulative, total = _wheel(roulette_weights(fitness))
+    step = total / n
+    pointers = rng.random() * step + step * np.arange(n)
+    indices = np.searchsorted(cumulative, pointers, side='right')
+    return np.minimum(indices, len(cumulative) - 1)
+
+def select_tournament(fitness, n, rng, size=2):
+    """
+    n tournaments, each one won by the fittest of size individuals drawn with replacement
+    """
+    fitness = np.asarray(fitness, dtype=float)
+    contestants = rng.integers(0, len(fitness), size=(n, size))
+    winners = np.argmax(fitness[contestants], axis=1)
+    return contestants[np.arange(n), winners]
+
+def select_rank(fitness, n, rng, pressure=1.5):
+    """
+    Linear rank selection: the worst gets weight 2 - pressure, the best gets pressure
+    """
+    fitness = np.asarray(fitness, dtype=float)
+    size = len(fitness)
+    ranks = np.empty(size)
+    ranks[np.argsort(fitness, kind='stable')] = np.arange(size)
+    if size > 1:
+        weights = (2 - pressure) + 2 * (pressure - 1) * ranks / (size - 1)
+    else:
+        weights = np.ones(size)
+    cumulative, total = _wheel(weights)
+    indices = np.searchsorted(cumulative, rng.random(n) * total, side='right')
+    return np.minimum(indices, size - 1)
+
+def select_top2(fitness, n):
+    """
+    Half of the next generation is the best individual, the other half the best one with a different fitness
+    """
+    fitness = np.asarray(fitness, dtype=float)
+    best = int(np.argmax(fitness))
+    others = np.nonzero(fitness != fitness[best])[0]
+    second = int(others[np.argmax(fitness[others])]) if len(others) > 0 else best
+    return np.array([best] * (n - n // 2) + [second] * (n // 2))
+
+def select_indices(fitness, n, rng, params):
+    """
+    Indices (with repeats) of the n individuals that form the next generation.
+    The params['elitism'] best individuals come first, the rest is drawn with params['method'].
+    """
+    fitness = np.asarray(fitness, dtype=float)
+    elitism = min(int(params['elitism']), n)
+    elite = np.argsort(-fitness, kind='stable')[:elitism]
+    rest = n - elitism
+
+    method = params['method']
+    if method == 'top':
+        chosen = select_top2(fitness, rest)
+    elif method == 'roulette':
+        chosen = select_roulette(fitness, rest, rng)
+    elif method == 'sus':
+        chosen = select_sus(fitness, rest, rng)
+    elif method == 'tournament':
+        chosen = select_tournament(fitness, rest, rng, params['tournament_size'])
+    elif method == 'rank':
+        chosen = select_rank(fitness, rest, rng, params['rank_pressure'])
+    else:
+        raise RuntimeError('Selection methods require: ' + ', '.join(METHODS) + '.')
+    return np.concatenate([elite, chosen]).astype(int)
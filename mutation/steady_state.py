@@ -0,0 +1,217 @@
+import random
+import numpy as np
+
+from concurrent.futures import wait, FIRST_COMPLETED
+from datetime import datetime
+from loguru import logger
+
+from mutation.genetic_algorithm import GeneticMutator
+from mutation.selection import select_indices
+from mutation import restart
+from mutation import tools
+
+REPLACEMENTS = ('worst', 'parent', 'oldest')
+
+class SteadyStateMutator(GeneticMutator):
+    """
+    Asynchronous steady-state GA: one offspring is bred per finished evaluation, so every simulator stays busy.
+    A finished offspring enters the population through the replacement policy:
+        worst: replaces the worst individual if it is at least as fit
+        parent: replaces the less fit of its parents (at their slots) if it is at least as fit
+        oldest: always replaces the individual that entered the population first
+
+    Every pop_size evaluations form an epoch, the unit of checkpoints, the archive, progress.log and
+    the restart/LIS triggers:
+        restart: the global best did not improve for restart_window evaluations since the last restart
+        LIS: the epoch best beats the best since the last restart, minLisGen epochs after it
+    Progress lines are named by evaluation count (eval_<n>).
+    """
+
+    def __init__(self, runner, selection, output_path, scenario_name, bounds, pm, pc, pop_size, NPC_size, time_size, max_gen, population_backend='list', seed=None, diversity_sample_size=None, surrogate_cfgs=None, lis_cfgs=None, steady_state_cfgs=None, resume=False):
+        super(SteadyStateMutator, self).__init__(runner, selection, output_path, scenario_name, bounds, pm, pc, pop_size, NPC_size, time_size, max_gen, population_backend, seed, diversity_sample_size, surrogate_cfgs, lis_cfgs, resume)
+        cfgs = steady_state_cfgs if steady_state_cfgs else {}
+        self.max_evaluations = cfgs.get('max_evaluations') or max_gen * pop_size
+        self.replacement = cfgs.get('replacement', 'worst')
+        self.max_in_flight = cfgs.get('max_in_flight') or runner.pool.size
+        self.restart_window = cfgs.get('restart_window') or 5 * pop_size
+        if self.replacement not in REPLACEMENTS:
+            raise RuntimeError('Replacement policies require: ' + ', '.join(REPLACEMENTS) + '.')
+
+        self.evaluations = 0
+        self.births = []                    # evaluation count at which each slot was filled, for 'oldest'
+        self.lastImprovementEval = 0
+        self.lastRestartEval = 0
+        self.bests = []                     # best of every epoch
+
+    def state(self):
+        # offspring in flight when the state is saved are bred again after a resume
+        state = super(SteadyStateMutator, self).state()
+        state['evaluations'] = self.evaluations
+        state['births'] = self.births
+        state['lastImprovementEval'] = self.lastImprovementEval
+        state['lastRestartEval'] = self.lastRestartEval
+        return state
+
+    def restore_state(self, state):
+        super(SteadyStateMutator, self).restore_state(state)
+        self.evaluations = state['evaluations']
+        self.births = state['births']
+        self.lastImprovementEval = state['lastImprovementEval']
+        self.lastRestartEval = state['lastRestartEval']
+
+    def breed(self):
+        """
+        Returns (offspring, parent slots): crossover swaps one NPC with the second parent with probability pc,
+        mutation changes one gene with probability pm, an offspring equal to its parent is always mutated
+        """
+        fitness = [eachChs.fitness for eachChs in self.pop]
+        parents = select_indices(fitness, 2, self.rng, dict(self.selection, elitism=0))
+        child = self.pop[parents[0]].clone()
+
+        varied = False
+        if self.pc > random.random():
+            swap_index = random.randint(0, self.NPC_size - 1)
+            child.own_scenario()[swap_index] = [list(gene) for gene in self.pop[parents[1]].scenario[swap_index]]
+            varied = True
+
+        if not varied or self.pm >= random.random():
+            npc_index, time_index, action_index, value = tools.choose_gene_edit(child.scenario, self.bounds, self.surrogate)
+            child.own_scenario()[npc_index][time_index][action_index] = value
+
+        # only the id: a parent object reference would keep the whole ancestry alive
+        child.parent_id = self.pop[parents[0]].scenario_id
+        return child, parents
+
+    def replace(self, child, parents):
+        """
+        Insert an evaluated offspring by the replacement policy, returns the replaced slot or None
+        """
+        if self.replacement == 'worst':
+            slot = int(np.argmin([eachChs.fitness for eachChs in self.pop]))
+        elif self.replacement == 'parent':
+            slot = int(min(parents, key=lambda k: self.pop[k].fitness))
+        else:
+            slot = int(np.argmin(self.births))
+
+        if self.replacement != 'oldest' and child.fitness < self.pop[slot].fitness:
+            return None
+        self.pop[slot] = child
+        self.births[slot] = self.evaluations
+        return slot
+
+    def dispatch(self, pending):
+        while len(pending) < self.max_in_flight and self.evaluations + len(pending) < self.max_evaluations:
+            child, parents = self.breed()
+            pending.append((self.runner.submit(child.scenario, self.next_generation, child.parent_id), child, parents))
+
+    def collect(self, pending, wait_all=False):
+        """
+        Wait for finished evaluations (all pending ones if wait_all) and insert them into the population
+        """
+        if len(pending) == 0:
+            return
+        futures = [future for future, _, _ in pending]
+        if wait_all:
+            wait(futures)
+        else:
+            wait(futures, return_when=FIRST_COMPLETED)
+
+        for entry in [entry for entry in pending if entry[0].done()]:
+            pending.remove(entry)
+            future, child, parents = entry
+            self.evaluations += 1
+            try:
+                fitness, scenario_id = future.result()
+            except Exception as e:
+                logger.error('Evaluation ' + str(self.evaluations) + ' failed: ' + str(e))
+                continue
+
+            child.fitness = fitness
+            child.scenario_id = scenario_id
+            slot = self.replace(child, parents)
+
+            self.events.emit('steady_eval', name='eval_' + str(self.evaluations), scenario_id=scenario_id, fitness=fitness, replaced=slot)
+
+            if fitness > self.g_best.fitness:
+                self.g_best = child.clone()
+                self.lastImprovementEval = self.evaluations
+
+    def end_epoch(self, epoch, pending):
+        best, bestIndex = self.find_best()
+        self.bests.append(best.clone())
+
+        self.checkpoint(epoch)
+        now = datetime.now()
+        date_time = now.strftime("%m-%d-%Y-%H-%M-%S")
+        self.archive.append(self.pop)
+        similarity, similarity_error = self.diversity.update()
+        logger.debug(" ==== Similarity compared with all prior epochs: " + str(similarity) + " (+/- " + str(similarity_error) + ")")
+
+        name = 'eval_' + str(self.evaluations)
+        self.events.emit('progress', name=name, best_fitness=best.fitness, global_best_fitness=self.g_best.fitness, similarity=similarity, date_time=date_time)
+
+        #################### Restart: no improvement of the global best within restart_window evaluations ###################
+        if self.evaluations - max(self.lastImprovementEval, self.lastRestartEval) >= self.restart_window:
+            logger.info("    ### Restart after " + str(self.evaluations) + " evaluations ###    ")
+            self.collect(pending, wait_all=True)
+            self.pop = restart.generate_restart_scenarios(self.runner, self.ga_log, epoch, self.archive, 1000, self.bounds, self.surrogate, self.restart_shortlist)
+            self.evaluations += len(self.pop)
+            self.births = [self.evaluations] * len(self.pop)
+            self.hasRestarted = True
+            best, bestIndex = self.find_best()
+            self.bestYAfterRestart = best.fitness
+            self.lastRestartEval = self.evaluations
+            if best.fitness > self.g_best.fitness:
+                self.g_best = best.clone()
+                self.lastImprovementEval = self.evaluations
+            similarity, _ = self.diversity.measure(tools.stack_scenarios(self.pop))
+            self.events.emit('progress', name=name + '_restart', best_fitness=best.fitness, global_best_fitness=self.g_best.fitness, similarity=similarity, date_time=date_time)
+            return
+
+        #################### LIS: the epoch best improved, minLisGen epochs after the last restart ###################
+        if best.fitness > self.bestYAfterRestart:
+            self.bestYAfterRestart = best.fitness
+            if self.evaluations > self.lastRestartEval + self.minLisGen * self.pop_size:
+                self.start_lis('eval_' + str(self.evaluations), epoch)
+
+    def merge_lis(self, lisBestChs):
+        slot = super(SteadyStateMutator, self).merge_lis(lisBestChs)
+        if slot is not None:
+            self.births[slot] = self.evaluations
+            self.lastImprovementEval = self.evaluations
+        return slot
+
+    def process(self):
+
+        if self.g_best is None: # not resumed
+            best, bestIndex = self.find_best()
+            self.g_best = best.clone()
+            self.births = [0] * len(self.pop)
+
+            self.events.emit('progress_header')
+
+            now = datetime.now()
+            date_time = now.strftime("%m-%d-%Y-%H-%M-%S")
+            self.events.emit('progress', name='initialization', best_fitness=best.fitness, global_best_fitness=self.g_best.fitness, similarity="0000", date_time=date_time)
+            self.save_state(0)
+
+        logger.info("    *** Steady-state GA: " + str(self.max_evaluations) + " evaluations, " + str(self.max_in_flight) + " in flight ***    ")
+        pending = []
+        epoch = self.next_generation
+        epoch_end = self.evaluations + self.pop_size
+        self.dispatch(pending)
+        while len(pending) > 0:
+            self.collect(pending)
+            if self.evaluations >= epoch_end:
+                logger.info("    *** " + str(self.evaluations) + " evaluations ***    ")
+                self.end_epoch(epoch, pending)
+                self.collect_lis()
+                if self.migration is not None:
+                    self.migration.exchange(self, epoch)
+                epoch += 1
+                self.save_state(epoch)
+                epoch_end = self.evaluations + self.pop_size # a restart also counts its evaluations
+            self.dispatch(pending)
+
+        self.collect_lis(wait=True)
+        return self.g_best
@@ -0,0 +1,167 @@
+import os
+import glob
+import pickle
+import threading
+import numpy as np
+
+from loguru import logger
+
+from mutation import tools
+
+METHODS = ('knn', 'ridge')
+
+class Surrogate(object):
+    """
+    Fitness predictor over evaluated scenarios, used to spend simulator time on promising candidates.
+    Features are the flattened cumulative npc trajectories (tools.npc_trajectories), the points the
+    scenario distance compares.
+        knn: mean fitness of the k nearest evaluated scenarios
+        ridge: ridge regression, trained incrementally through the running X^T X and X^T y
+    exploration: fraction of the picks drawn at random instead of by prediction, so the search does not
+    collapse onto what the model already knows.
+    Predictions are only used once min_samples scenarios are known, before that candidates are picked at random.
+    """
+
+    def __init__(self, npc_size, time_size, method='knn', k=5, alpha=1.0, exploration=0.2, min_samples=20, proposals=4, rng=None):
+        if method not in METHODS:
+            raise RuntimeError('Surrogate methods require: ' + ', '.join(METHODS) + '.')
+        self.npc_size = npc_size
+        self.time_size = time_size
+        self.method = method
+        self.k = k
+        self.alpha = alpha
+        self.exploration = exploration
+        self.min_samples = max(min_samples, k)
+        self.proposals = proposals # candidate mutations scored per mutated scenario
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        dim = npc_size * time_size * 2
+        self._lock = threading.Lock()
+        self._features = np.empty((256, dim))
+        self._fitness = np.empty(256)
+        self.size = 0
+
+        # ridge normal equations, last feature is the intercept
+        self._xtx = np.zeros((dim + 1, dim + 1))
+        self._xty = np.zeros(dim + 1)
+        self._weights = None
+
+    @property
+    def ready(self):
+        return self.size >= self.min_samples
+
+    def features(self, genomes):
+        genomes = np.asarray(genomes, dtype=float).reshape(-1, self.npc_size, self.time_size, 2)
+        return tools.npc_trajectories(genomes).reshape(len(genomes), -1)
+
+    def add(self, genomes, fitness):
+        """
+        Train on evaluated (n, npc_size, time_size, 2) genomes, non-finite fitness values are skipped
+        """
+        fitness = np.asarray(fitness, dtype=float).reshape(-1)
+        valid = np.isfinite(fitness)
+        if not valid.any():
+            return
+        features = self.features(genomes)[valid]
+        fitness = fitness[valid]
+
+        with self._lock:
+            end = self.size + len(fitness)
+            if end > self._features.shape[0]:
+                capacity = max(end, 2 * self._features.shape[0])
+                grown = np.empty((capacity, self._features.shape[1]))
+                grown[:self.size] = self._features[:self.size]
+                self._features = grown
+                grown = np.empty(capacity)
+                grown[:self.size] = self._fitness[:self.size]
+                self._fitness = grown
+            self._features[self.size:end] = features
+            self._fitness[self.size:end] = fitness
+            self.size = end
+
+            augmented = np.hstack([features, np.ones((len(features), 1))])
+            self._xtx += augmented.T @ augmented
+            self._xty += augmented.T @ fitness
+            self._weights = None
+
+    def add_scenario(self, scenario, fitness):
+        """
+        Runner result listener: one evaluated nested-list scenario
+        """
+        self.add(tools.stack_scenarios([scenario]), [fitness])
+
+    def warm_start(self, simulation_dirs):
+        """
+        Train on the scenarios/*.obj and results/*.obj pairs saved by the Runner of earlier campaigns,
+        each directory is an <output_path>/simulation folder
+        """
+        genomes = []
+        fitness = []
+        for simulation_dir in simulation_dirs:
+            for scenario_file in glob.glob(os.path.join(simulation_dir, 'scenarios', '*.obj')):
+                result_file = os.path.join(simulation_dir, 'results', os.path.basename(scenario_file))
+                if not os.path.isfile(result_file):
+                    continue
+                try:
+                    with open(scenario_file, 'rb') as f:
+                        scenario = pickle.load(f)
+                    with open(result_file, 'rb') as f:
+                        result = pickle.load(f)
+                    genome = tools.stack_scenarios([scenario])
+                except Exception:
+                    continue
+                if genome.shape[1:] != (self.npc_size, self.time_size, 2) or 'fitness' not in result:
+                    continue
+                genomes.append(genome[0])
+                fitness.append(float(result['fitness']))
+        if len(genomes) > 0:
+            self.add(np.asarray(genomes), fitness)
+        logger.info('Surrogate warm start: ' + str(len(genomes)) + ' scenarios from ' + str(len(simulation_dirs)) + ' folders')
+
+    def predict(self, genomes, chunk_size=1024):
+        features = self.features(genomes)
+        with self._lock:
+            if self.method == 'ridge':
+                if self._weights is None:
+                    penalty = self.alpha * np.eye(self._xtx.shape[0])
+                    penalty[-1, -1] = 0.0 # intercept is not penalized
+                    self._weights = np.linalg.solve(self._xtx + penalty, self._xty)
+                return features @ self._weights[:-1] + self._weights[-1]
+
+            known = self._features[:self.size]
+            known_fitness = self._fitness[:self.size]
+            known_norms = (known ** 2).sum(axis=1)
+
+        k = min(self.k, len(known_fitness))
+        predictions = np.empty(len(features))
+        for start in range(0, len(features), chunk_size):
+            chunk = features[start:start + chunk_size]
+            squared = (chunk ** 2).sum(axis=1)[:, None] + known_norms[None] - 2 * chunk @ known.T
+            nearest = np.argpartition(squared, k - 1, axis=1)[:, :k]
+            predictions[start:start + chunk_size] = known_fitness[nearest].mean(axis=1)
+        return predictions
+
+    def select(self, genomes, n):
+        """
+        Indices of the n candidates to simulate: the best predicted ones plus an exploration fraction drawn at random
+        """
+        candidates = len(genomes)
+        n = min(n, candidates)
+        if not self.ready:
+            return self.rng.permutation(candidates)[:n]
+
+        n_explore = int(round(n * self.exploration))
+        ranked = np.argsort(-self.predict(genomes), kind='stable')
+        exploit = ranked[:n - n_explore]
+        explore = self.rng.permutation(ranked[n - n_explore:])[:n_explore]
+        return np.concatenate([exploit, explore]).astype(int)
+
+    def pick(self, genomes, rng=None):
+        """
+        Index of the one candidate to simulate, best predicted or with probability exploration a random one.
+        rng: generator of the calling thread (background LIS), default self.rng
+        """
+        rng = rng if rng is not None else self.rng
+        if not self.ready or rng.random() < self.exploration:
+            return int(rng.integers(len(genomes)))
+        return int(np.argmax(self.predict(genomes)))
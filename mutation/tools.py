@@ -1,4 +1,6 @@
 import math
+import random
+import numpy as np
                                                                     
 def get_similarity_between_npcs(npc1, npc2):
     accumD = 0.0
@@ -7,11 +9,6 @@ def get_similarity_between_npcs(npc1, npc2):
     v1 = 0.0
     v2 = 0.0
 
-    x = []
-    y = []
-    x1 = []
-    y1 = []
-
     for i in range(len(npc1)):
         v1 += npc1[i][0]
         v2 += npc2[i][0]
@@ -26,10 +23,6 @@ def get_similarity_between_npcs(npc1, npc2):
             horD2 += -34.0
         elif a2 == 2:
             horD2 += 34.0
-        x.append(horD1)
-        y.append(v1)
-        x1.append(horD2)
-        y1.append(v2)
 
         curED = math.sqrt(math.pow(v1 - v2, 2) + math.pow(horD1 - horD2, 2))
         accumD += curED
@@ -51,6 +44,71 @@ def get_similarity_between_scenarios(scenario1, scenario2):
 
     return scenario_sim_total / npc_size + 0.0
 
-###################################################################################### 
+def stack_scenarios(scenarios):
+    """
+    list of nested-list scenarios (or CorpusElements) -> (n, npc_size, time_size, 2) genome array
+    """
+    return np.asarray([getattr(scenario, 'scenario', scenario) for scenario in scenarios], dtype=float)
+
+def npc_trajectories(genomes):
+    """
+    (..., time_size, 2) genomes -> (..., time_size, 2) cumulative [velocity, lateral offset] per time step,
+    the points compared by get_similarity_between_npcs
+    """
+    genomes = np.asarray(genomes, dtype=float)
+    trajectories = np.empty(genomes.shape)
+    np.cumsum(genomes[..., 0], axis=-1, out=trajectories[..., 0])
+    actions = genomes[..., 1]
+    lateral = np.where(actions == 1, -34.0, np.where(actions == 2, 34.0, 0.0))
+    np.cumsum(lateral, axis=-1, out=trajectories[..., 1])
+    return trajectories
+
+def get_distance_matrix(genomes1, genomes2, chunk_size=None):
+    """
+    (n1, npc_size, time_size, 2) x (n2, npc_size, time_size, 2) genomes -> (n1, n2) matrix of
+    get_similarity_between_scenarios for every pair.
+    chunk_size: rows of genomes1 computed at once, bounds the temporary memory to
+    chunk_size * n2 * npc_size * time_size floats, None computes all rows at once
+    """
+    trajectories1 = npc_trajectories(genomes1)
+    trajectories2 = npc_trajectories(genomes2)
+    n1 = trajectories1.shape[0]
+    n2 = trajectories2.shape[0]
+    chunk_size = n1 if chunk_size is None else max(1, chunk_size)
+
+    distances = np.empty((n1, n2))
+    for start in range(0, n1, chunk_size):
+        chunk = trajectories1[start:start + chunk_size, None]
+        diff = chunk - trajectories2[None]
+        step_distances = np.sqrt(diff[..., 0] ** 2 + diff[..., 1] ** 2) # (chunk, n2, npc_size, time_size)
+        distances[start:start + chunk_size] = step_distances.sum(axis=-1).mean(axis=-1)
+    return distances
+
+def random_gene_edit(bounds, npc_size, time_size, rand=random):
+    """
+    (npc_index, time_index, 0 velocity / 1 action, new value) of a random single gene mutation
+    rand: the random module or a random.Random of the calling thread
+    """
+    npc_index = rand.randint(0, npc_size - 1)
+    time_index = rand.randint(0, time_size - 1)
+    action_index = rand.randint(0, 1)
+    if action_index == 0:
+        value = rand.uniform(bounds[0][0], bounds[0][1])
+    else:
+        value = rand.randrange(bounds[1][0], bounds[1][1])
+    return npc_index, time_index, action_index, value
+
+def choose_gene_edit(scenario, bounds, surrogate=None, rand=random, rng=None):
+    """
+    A random gene edit of scenario, with a ready surrogate the one picked from surrogate.proposals random edits.
+    rand, rng: random.Random and numpy Generator of the calling thread, default the random module and surrogate.rng
+    """
+    npc_size, time_size = len(scenario), len(scenario[0])
+    if surrogate is None or not surrogate.ready or surrogate.proposals <= 1:
+        return random_gene_edit(bounds, npc_size, time_size, rand)
 
-    
+    edits = [random_gene_edit(bounds, npc_size, time_size, rand) for _ in range(surrogate.proposals)]
+    candidates = np.repeat(stack_scenarios([scenario]), len(edits), axis=0)
+    for k, (npc_index, time_index, action_index, value) in enumerate(edits):
+        candidates[k, npc_index, time_index, action_index] = value
+    return edits[surrogate.pick(candidates, rng)]
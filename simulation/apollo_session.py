@@ -0,0 +1,102 @@
+from loguru import logger
+
+import simulation.utils as util
+import simulation.dreamview as dreamview
+
+class ApolloSession(object):
+    """
+    Dreamview connection and configured Apollo (map, vehicle, modules) of one simulator worker,
+    kept alive across simulations. Every run only re-binds the new ego, re-sends the routing request and waits
+    for a control message to the new ego (see Simulator.runSimulation); the full setup is repeated when the
+    health check fails or no control message comes within control_timeout simulated seconds.
+    """
+
+    def __init__(self, sim, host, port, apollo_map, vehicle, modules, status_max_age=2.0, warm=True, control_timeout=10.0):
+        self.sim = sim
+        self.host = host
+        self.port = port
+        self.apollo_map = apollo_map
+        self.vehicle = vehicle
+        self.modules = modules
+        self.status_max_age = status_max_age
+        self.warm = warm
+        self.control_timeout = control_timeout
+
+        self.dv = None
+        self.configured = False
+        self.full_setups = 0
+        self.warm_starts = 0
+
+    def healthy(self):
+        if self.dv is None or not self.configured:
+            return False
+        try:
+            module_status = self.dv.get_cached_module_status(self.status_max_age)
+        except Exception as e:
+            logger.warning(' --- Apollo session health check failed: ' + str(e))
+            return False
+        closed_modules = util.modules_in_wrong_state(module_status, self.modules, True)
+        if len(closed_modules) > 0:
+            logger.warning(' --- Apollo session health check failed: ' + ', '.join(closed_modules) + ' not running')
+            return False
+        return True
+
+    def prepare(self, ego, destination):
+        """
+        Returns (dreamview connection with Apollo ready to drive ego, routed).
+        routed: the routing request to destination was sent and answered (a control message came), the caller
+        does not send it again. After a full setup the caller re-sends it once the recorder restarted.
+        """
+        if self.warm and self.healthy():
+            self.dv.set_ego(ego)
+            self.dv.set_destination(destination.x, destination.z)
+            if self.dv.wait_control(self.control_timeout):
+                self.warm_starts += 1
+                logger.info(' --- Reuse Apollo session (warm starts: ' + str(self.warm_starts) + ', full setups: ' + str(self.full_setups) + ')')
+                return self.dv, True
+            logger.warning(' --- No control message within ' + str(self.control_timeout) + 's on the reused Apollo session, set it up again')
+
+        self.full_setup(ego, destination)
+        return self.dv, False
+
+    def full_setup(self, ego, destination):
+        self.close()
+        times = 0
+        success = False
+        while times < 3:
+            try:
+                dv = dreamview.Connection(self.sim, self.host, str(self.port))
+                dv.set_ego(ego)
+                dv.set_hd_map(self.apollo_map)
+                dv.set_vehicle(self.vehicle)
+                dv.setup_apollo(destination.x, destination.z, self.modules, default_timeout=30)
+                success = True
+                break
+            except Exception:
+                logger.warning('Fail to spin up apollo, try again!')
+                times += 1
+        if not success:
+            raise RuntimeError('Fail to spin up apollo')
+
+        # module states are pushed to a cached snapshot, stopped modules are restarted by the listener
+        dv.watch_modules(self.modules)
+        dv.start_status_listener()
+
+        self.dv = dv
+        self.configured = True
+        self.full_setups += 1
+
+    def invalidate(self):
+        """
+        Force a full setup on the next run
+        """
+        self.configured = False
+
+    def close(self):
+        if self.dv is not None:
+            try:
+                self.dv.disconnect()
+            except Exception as e:
+                logger.debug(str(e))
+        self.dv = None
+        self.configured = False
@@ -4,7 +4,7 @@
 # This software contains code licensed as described in LICENSE.
 #
 
-from websocket import create_connection
+from websocket import create_connection, WebSocketTimeoutException
 from enum import Enum
 import json
 import lgsvl
@@ -12,6 +12,8 @@ import math
 import logging
 import sys
 import os
+import threading
+import time
 
 log = logging.getLogger(__name__)
 
@@ -36,6 +38,18 @@ class Connection:
         self.ws = create_connection(self.url)
         self.gps_offset = lgsvl.Vector()
 
+        # status subscription, see start_status_listener
+        self.status_ws = None
+        self.status_thread = None
+        self.status_lock = threading.Lock()
+        self.listening = False
+        self.hmi_status = None
+        self.last_message_time = 0.0
+        self.status_callbacks = []
+        self.watched_modules = []
+        self.restart_interval = 2.0
+        self.last_restart = {}
+
     def set_ego(self, ego_agent):
         self.ego = ego_agent
 
@@ -236,6 +250,29 @@ class Connection:
 
         return data["data"]["modules"]
 
+    def get_route_info(self, timeout=1.0):
+        """
+        Returns (routing_time, route_path) of the last routing response received by Dreamview.
+        routing_time is None if this Dreamview does not report it, route_path is empty before any routing succeeded
+        or if Dreamview does not answer within timeout seconds
+        """
+        self.ws.send(json.dumps({"type": "RequestRoutePath"}))
+        deadline = time.time() + timeout
+        self.ws.settimeout(timeout)
+        try:
+            while time.time() < deadline:
+                try:
+                    data = json.loads(self.ws.recv())
+                except ValueError:
+                    continue # binary simulation world frames
+                if data.get("type") == "RoutePath":
+                    return data.get("routingTime"), data.get("routePath", [])
+        except WebSocketTimeoutException:
+            pass
+        finally:
+            self.ws.settimeout(None)
+        return None, []
+
     def get_current_map(self):
         """
         Returns the current HD Map loaded in Dreamview
@@ -277,9 +314,107 @@ class Connection:
         return
 
     def disconnect(self):
+        self.stop_status_listener()
         self.ws.close()
         return
 
+    def start_status_listener(self):
+        """
+        Keeps a second, long-lived websocket open and caches every HMIStatus pushed by Dreamview.
+        Dreamview pushes HMIStatus when the status changes and other messages (SimControlStatus, ...) periodically,
+        so any received message proves the cached status is still current.
+        """
+        if self.listening:
+            return
+        self.status_ws = create_connection(self.url)
+        self.listening = True
+        self.status_thread = threading.Thread(target=self._status_loop, name='dreamview_status', daemon=True)
+        self.status_thread.start()
+
+    def stop_status_listener(self):
+        if not self.listening:
+            return
+        self.listening = False
+        try:
+            self.status_ws.close()
+        except Exception:
+            pass
+        self.status_thread.join(timeout=5)
+        self.status_thread = None
+
+    def on_status_change(self, callback):
+        """
+        callback(module, status) is called from the listener thread whenever a module changes its state
+        """
+        self.status_callbacks.append(callback)
+
+    def watch_modules(self, modules, restart_interval=2.0):
+        """
+        Restart any of these modules as soon as the listener sees it stopped,
+        at most once every restart_interval seconds per module
+        """
+        self.watched_modules = list(modules)
+        self.restart_interval = restart_interval
+
+    def _status_loop(self):
+        while self.listening:
+            try:
+                data = json.loads(self.status_ws.recv())
+            except Exception as e:
+                if not self.listening:
+                    break
+                log.warning("Dreamview status listener lost connection: " + str(e))
+                time.sleep(0.5)
+                try:
+                    self.status_ws = create_connection(self.url)
+                except Exception:
+                    pass
+                continue
+
+            now = time.time()
+            with self.status_lock:
+                self.last_message_time = now
+                if data.get("type") != "HMIStatus":
+                    continue
+                previous = self.hmi_status
+                self.hmi_status = data["data"]
+
+            previous_modules = previous["modules"] if previous else {}
+            for module, status in data["data"]["modules"].items():
+                if previous_modules.get(module) != status:
+                    for callback in self.status_callbacks:
+                        callback(module, status)
+                if (not status) and module in self.watched_modules:
+                    self._restart_module(module, now)
+
+    def _restart_module(self, module, now):
+        if now - self.last_restart.get(module, 0.0) < self.restart_interval:
+            return
+        self.last_restart[module] = now
+        log.warning("Apollo module {} is not running, restart it".format(module))
+        # the listener socket is only used by this thread, so it is safe to send on it
+        self.status_ws.send(
+            json.dumps({"type": "HMIAction", "action": "START_MODULE", "value": module})
+        )
+
+    def get_status_snapshot(self, max_age=2.0):
+        """
+        Latest HMIStatus data from the listener, or None if nothing was received within max_age seconds
+        """
+        with self.status_lock:
+            if self.hmi_status is None or time.time() - self.last_message_time > max_age:
+                return None
+            return self.hmi_status
+
+    def get_cached_module_status(self, max_age=2.0):
+        """
+        Same as get_module_status, served from the listener cache while it is fresh
+        """
+        snapshot = self.get_status_snapshot(max_age) if self.listening else None
+        if snapshot is None:
+            return self.get_module_status()
+        return dict(snapshot["modules"])
+
     def enable_apollo(self, dest_x, dest_z, modules, coord_type=CoordType.Unity):
         """
         Enables a list of modules and then sets the destination
@@ -358,6 +493,29 @@ class Connection:
 
         self.ego.state = initial_state
 
+    def wait_control(self, timeout, run_time=0.5):
+        """
+        Readiness check of setup_apollo without starting modules: runs the simulation in run_time steps until
+        ego receives a control message. Returns False if none came within timeout simulated seconds.
+        Ego is put back to its initial state.
+        """
+        initial_state = self.ego.state
+        self.ego.is_control_received = False
+
+        def on_control_received(agent, kind, context):
+            if kind == "checkControl":
+                agent.is_control_received = True
+
+        self.ego.on_custom(on_control_received)
+
+        elapsed = 0.0
+        while not self.ego.is_control_received and elapsed < timeout:
+            self.sim.run(run_time)
+            elapsed += run_time
+
+        self.ego.state = initial_state
+        return self.ego.is_control_received
+
 
 class WaitApolloError(Exception):
     """
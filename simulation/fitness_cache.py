@@ -0,0 +1,117 @@
+import os
+import json
+import pickle
+import hashlib
+import threading
+import collections
+
+import numpy as np
+
+from loguru import logger
+
+class FitnessCache(object):
+    """
+    Memoize simulation outputs by the content of the scenario.
+    key: hash of (scenario genome, scenario env json, simulation params: sim time, maps, stop rules, adaptive step)
+    value: fitness samples, fault list and the scenario id of the first run (in the campaign that ran it)
+    The file is rewritten every save_every new samples and on flush(), a crash loses at most save_every samples.
+    """
+
+    def __init__(self, cache_file, scenario_env_json, sim_params, max_entries=10000, resample=1, save_every=20):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.resample = max(1, int(resample)) # number of simulations before an entry is served from the cache
+        self.save_every = max(1, int(save_every))
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        with open(scenario_env_json, 'r') as f:
+            env_data = json.load(f)
+        self._env_key = json.dumps(env_data, sort_keys=True)
+        self._params_key = json.dumps(sim_params, sort_keys=True)
+
+        self.entries = collections.OrderedDict() # LRU order, oldest first
+        self.load()
+
+    def key(self, scenario_data):
+        content = json.dumps(scenario_data) + '|' + self._env_key + '|' + self._params_key
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Returns (fitness, fault, scenario_id) or None if the scenario still has to be simulated
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or len(entry['samples']) < self.resample:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return float(np.mean(entry['samples'])), entry['fault'], entry['scenario_id']
+
+    def put(self, key, fitness, fault, scenario_id):
+        """
+        Add one simulation sample, returns the fitness to report (mean over samples)
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = {
+                    'samples': [],
+                    'fault': [],
+                    'scenario_id': scenario_id
+                }
+                self.entries[key] = entry
+            self.entries.move_to_end(key)
+
+            entry['samples'].append(float(fitness))
+            for item in fault:
+                if item not in entry['fault']:
+                    entry['fault'].append(item)
+
+            if self.resample > 1 and len(entry['samples']) == self.resample:
+                logger.info(' --- Fitness noise of ' + entry['scenario_id'] + ': mean ' + str(np.mean(entry['samples'])) + ', std ' + str(np.std(entry['samples'])))
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+            self._unsaved += 1
+            if self._unsaved >= self.save_every:
+                self._save()
+            return float(np.mean(entry['samples']))
+
+    def flush(self):
+        with self._lock:
+            if self._unsaved > 0:
+                self._save()
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / float(total) if total > 0 else 0.0
+        return 'hits ' + str(self.hits) + ', misses ' + str(self.misses) + ', hit rate ' + str(round(hit_rate, 3)) + ', entries ' + str(len(self.entries))
+
+    def load(self):
+        if not os.path.isfile(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'rb') as f:
+                self.entries = pickle.load(f)
+        except Exception as e:
+            logger.warning('Fail to load fitness cache ' + self.cache_file + ': ' + str(e))
+            self.entries = collections.OrderedDict()
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        logger.info('Loaded ' + str(len(self.entries)) + ' entries from fitness cache ' + self.cache_file)
+
+    def _save(self):
+        cache_folder = os.path.dirname(self.cache_file)
+        if cache_folder and not os.path.exists(cache_folder):
+            os.makedirs(cache_folder)
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(self.entries, f)
+        os.replace(tmp_file, self.cache_file)
+        self._unsaved = 0
@@ -205,3 +205,102 @@ def compute_danger_fitness(ego, npc, collision=False):
     
     return fitness
 
+########################## vectorized kernels ##########################
+# Trajectories are arrays over frames:
+#   positions: (F, 2) world x, z
+#   headings: (F,) rotation.y in degree
+#   velocities: (F, 3)
+# A bounding box is described once by its half extents (hx, hz), shrunk by 0.1 like get_bbox
+
+def bbox_half_extents(bbox):
+    x_min = bbox.min.x + 0.1
+    x_max = bbox.max.x - 0.1
+    z_min = bbox.min.z + 0.1
+    z_max = bbox.max.z - 0.1
+    return np.array([(x_max - x_min) / 2.0, (z_max - z_min) / 2.0])
+
+def stack_states(states):
+    """
+    list of lgsvl.AgentState -> (positions, headings, velocities)
+    """
+    positions = np.array([[s.transform.position.x, s.transform.position.z] for s in states], dtype=float)
+    headings = np.array([s.transform.rotation.y for s in states], dtype=float)
+    velocities = np.array([[s.velocity.x, s.velocity.y, s.velocity.z] for s in states], dtype=float)
+    return positions, headings, velocities
+
+def obb_corners(positions, headings, half_extents):
+    """
+    Corners of the oriented boxes, (F, 4, 2), same order and rotation as get_bbox
+    """
+    theta = np.radians(headings)
+    cos_t = np.cos(theta)[:, None]
+    sin_t = np.sin(theta)[:, None]
+    hx, hz = half_extents[0], half_extents[1]
+    dx = np.array([-hx, hx, hx, -hx])[None, :]
+    dz = np.array([-hz, -hz, hz, hz])[None, :]
+    corners = np.empty((len(positions), 4, 2))
+    corners[:, :, 0] = positions[:, 0:1] + dx * cos_t + dz * sin_t
+    corners[:, :, 1] = positions[:, 1:2] - dx * sin_t + dz * cos_t
+    return corners
+
+def _obb_overlap(corners_a, corners_b):
+    # separating axis test on the 2 edge normals of each box
+    axes = np.concatenate([corners_a[:, 1:3] - corners_a[:, 0:2], corners_b[:, 1:3] - corners_b[:, 0:2]], axis=1) # (F, 4, 2)
+    proj_a = np.einsum('fkd,fad->fka', corners_a, axes)
+    proj_b = np.einsum('fkd,fad->fka', corners_b, axes)
+    separated = (proj_a.max(axis=1) < proj_b.min(axis=1)) | (proj_b.max(axis=1) < proj_a.min(axis=1))
+    return ~separated.any(axis=1)
+
+def _points_to_edges(points, corners):
+    # min distance of every point (F, 4, 2) to every edge of the boxes (F, 4, 2)
+    seg_start = corners[:, None, :, :]
+    seg_vec = np.roll(corners, -1, axis=1)[:, None, :, :] - seg_start
+    rel = points[:, :, None, :] - seg_start
+    seg_len2 = np.maximum(np.sum(seg_vec ** 2, axis=-1), 1e-12)
+    t = np.clip(np.sum(rel * seg_vec, axis=-1) / seg_len2, 0.0, 1.0)
+    closest = rel - t[..., None] * seg_vec
+    return np.sqrt(np.sum(closest ** 2, axis=-1)).min(axis=(1, 2))
+
+def obb_distance(corners_a, corners_b):
+    """
+    Per frame polygon distance between two boxes, 0 if they overlap
+    """
+    d = np.minimum(_points_to_edges(corners_a, corners_b), _points_to_edges(corners_b, corners_a))
+    d[_obb_overlap(corners_a, corners_b)] = 0.0
+    return d
+
+def get_distance_and_speed_batch(ego_traj, ego_extents, npc_traj, npc_extents):
+    """
+    ego_traj, npc_traj: (positions, headings, velocities)
+    Returns per frame OBB-to-OBB distances and relative speeds, matches get_distance_ego_npc
+    """
+    ego_corners = obb_corners(ego_traj[0], ego_traj[1], ego_extents)
+    npc_corners = obb_corners(npc_traj[0], npc_traj[1], npc_extents)
+    distances = obb_distance(ego_corners, npc_corners)
+    speeds = np.linalg.norm(ego_traj[2] - npc_traj[2], axis=1)
+    return distances, speeds
+
+def compute_danger_fitness_batch(ego_traj, ego_extents, npc_traj, npc_extents):
+    """
+    compute_danger_fitness(collision=False) for all frames in one call
+    """
+    distances, speeds = get_distance_and_speed_batch(ego_traj, ego_extents, npc_traj, npc_extents)
+    return speeds / (distances + 1) ** 2
+
+def obb_line_hits(traj, extents, line_points):
+    """
+    Per frame flag whether the box touches the polyline, matches ego_yellow_line_fault / ego_edge_line_fault
+    """
+    corners = obb_corners(traj[0], traj[1], extents)
+    box_axes = corners[:, 1:3] - corners[:, 0:2] # (F, 2, 2)
+    hits = np.zeros(len(corners), dtype=bool)
+    line_points = np.asarray(line_points, dtype=float)
+    for seg_start, seg_end in zip(line_points[:-1], line_points[1:]):
+        seg_vec = seg_end - seg_start
+        seg_normal = np.broadcast_to(np.array([-seg_vec[1], seg_vec[0]]), (len(corners), 1, 2))
+        axes = np.concatenate([box_axes, seg_normal], axis=1) # (F, 3, 2)
+        proj_box = np.einsum('fkd,fad->fka', corners, axes)
+        proj_seg = np.stack([axes @ seg_start, axes @ seg_end], axis=1)
+        separated = (proj_box.max(axis=1) < proj_seg.min(axis=1)) | (proj_seg.max(axis=1) < proj_box.min(axis=1))
+        hits |= ~separated.any(axis=1)
+    return hits
@@ -0,0 +1,59 @@
+import time
+import collections
+
+from loguru import logger
+
+class ReadinessWaiter(object):
+    """
+    Poll readiness predicates instead of sleeping a fixed time, and keep per-wait timing telemetry of a run.
+    timings: name -> [number of waits, total seconds, number of timeouts]
+    """
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.timings = collections.OrderedDict()
+
+    def wait_until(self, name, predicate, timeout, interval=None):
+        """
+        Returns True once predicate() holds, False if it still does not after timeout seconds
+        """
+        interval = self.interval if interval is None else interval
+        start = time.time()
+        ready = predicate()
+        while not ready and time.time() - start < timeout:
+            time.sleep(interval)
+            ready = predicate()
+        elapsed = time.time() - start
+
+        record = self.timings.setdefault(name, [0, 0.0, 0])
+        record[0] += 1
+        record[1] += elapsed
+        if not ready:
+            record[2] += 1
+            logger.warning(' --- Wait for ' + name + ' timed out after ' + str(round(elapsed, 2)) + 's')
+        return ready
+
+    def record(self, name, elapsed):
+        """
+        Add a wait that was not done through wait_until
+        """
+        record = self.timings.setdefault(name, [0, 0.0, 0])
+        record[0] += 1
+        record[1] += elapsed
+
+    def summary(self):
+        """
+        name -> total seconds waited, for the result dict
+        """
+        return {name: round(record[1], 3) for name, record in self.timings.items()}
+
+    def log(self):
+        items = []
+        for name, record in self.timings.items():
+            item = name + ' ' + str(round(record[1], 2)) + 's'
+            if record[0] > 1:
+                item += ' (' + str(record[0]) + ' waits)'
+            if record[2] > 0:
+                item += ' (' + str(record[2]) + ' timeouts)'
+            items.append(item)
+        logger.info(' --- Wait timings: ' + ', '.join(items))
@@ -0,0 +1,107 @@
+import os
+import numpy as np
+
+# one record per agent per frame
+FRAME_DTYPE = np.dtype([
+    ('position', np.float64, (3,)),
+    ('rotation', np.float64, (3,)),
+    ('velocity', np.float64, (3,)),
+])
+
+class TrajectoryRecorder(object):
+    """
+    Preallocated trajectory of all recorded agents.
+    frames[t, k] holds position, rotation and velocity of agent k at frame t,
+    bounding boxes are stored once per agent.
+    """
+
+    __slots__ = ('agent_names', 'agent_index', 'frames', 'times', 'bbox', 'size')
+
+    def __init__(self, agent_names, capacity):
+        self.agent_names = list(agent_names)
+        self.agent_index = {name: k for k, name in enumerate(self.agent_names)}
+        self.frames = np.zeros((capacity, len(self.agent_names)), dtype=FRAME_DTYPE)
+        self.times = np.zeros(capacity)
+        self.bbox = np.zeros((len(self.agent_names), 2, 3)) # (min xyz, max xyz)
+        self.size = 0
+
+    def set_bbox(self, name, bbox):
+        k = self.agent_index[name]
+        self.bbox[k, 0] = [bbox.min.x, bbox.min.y, bbox.min.z]
+        self.bbox[k, 1] = [bbox.max.x, bbox.max.y, bbox.max.z]
+
+    def record(self, states, sim_time=None):
+        """
+        states: lgsvl.AgentState of every agent, in agent_names order
+        """
+        if self.size == len(self.frames):
+            self._grow()
+        row = self.frames[self.size]
+        for k, state in enumerate(states):
+            transform = state.transform
+            velocity = state.velocity
+            row[k] = ((transform.position.x, transform.position.y, transform.position.z),
+                      (transform.rotation.x, transform.rotation.y, transform.rotation.z),
+                      (velocity.x, velocity.y, velocity.z))
+        self.times[self.size] = self.size * 0.1 if sim_time is None else sim_time
+        self.size += 1
+
+    def _grow(self):
+        capacity = max(1, 2 * len(self.frames))
+        frames = np.zeros((capacity, len(self.agent_names)), dtype=FRAME_DTYPE)
+        frames[:self.size] = self.frames[:self.size]
+        times = np.zeros(capacity)
+        times[:self.size] = self.times[:self.size]
+        self.frames = frames
+        self.times = times
+
+    def half_extents(self, name):
+        """
+        (hx, hz) of the agent box, shrunk by 0.1 like liability.get_bbox
+        """
+        k = self.agent_index[name]
+        size = (self.bbox[k, 1] - 0.1) - (self.bbox[k, 0] + 0.1)
+        return np.array([size[0] / 2.0, size[2] / 2.0])
+
+    def trajectory(self, name, start=0, end=None):
+        """
+        (positions (F, 2) x-z, headings (F,), velocities (F, 3)) of one agent, views on the recording
+        """
+        end = self.size if end is None else min(end, self.size)
+        agent_frames = self.frames[start:end, self.agent_index[name]]
+        return agent_frames['position'][:, 0::2], agent_frames['rotation'][:, 1], agent_frames['velocity']
+
+    def save(self, path, actions, action_interval, collision=None):
+        """
+        Write the recording as a compressed .npz (float32), read back with simulation.trajectories:
+            agent_names (A,), times (F,), position/rotation/velocity (F, A, 3), bbox (A, 2, 3) min and max xyz
+            actions (npc, T, 2) speed and turn command of every action slice, action_times (T,) start of each slice
+            collision_frame: frame of the collision (-1 without one), collision_agents: the two agents (empty without one),
+            contact: (3,) contact point, nan without one
+        collision: {'frame', 'agents', 'contact'} or None
+        """
+        frames = self.frames[:self.size]
+        actions = np.asarray(actions, dtype=np.float32)
+        contact = np.full(3, np.nan, dtype=np.float32)
+        collision_frame = -1
+        collision_agents = np.array([], dtype=str)
+        if collision is not None:
+            collision_frame = min(collision['frame'], self.size - 1)
+            collision_agents = np.array(collision['agents'], dtype=str)
+            if collision.get('contact') is not None:
+                contact[:] = collision['contact']
+
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path,
+                            agent_names=np.array(self.agent_names, dtype=str),
+                            times=self.times[:self.size].astype(np.float32),
+                            position=frames['position'].astype(np.float32),
+                            rotation=frames['rotation'].astype(np.float32),
+                            velocity=frames['velocity'].astype(np.float32),
+                            bbox=self.bbox.astype(np.float32),
+                            actions=actions,
+                            action_times=(np.arange(actions.shape[1]) * action_interval).astype(np.float32),
+                            collision_frame=np.int32(collision_frame),
+                            collision_agents=collision_agents,
+                            contact=contact)
+        os.replace(tmp_path, path)
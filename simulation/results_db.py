@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import numpy as np
+
+from loguru import logger
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS runs (
+        scenario_id TEXT PRIMARY KEY,
+        genome BLOB,            -- float64 (npc_size, time_size, 2) bytes
+        npc_size INTEGER,
+        time_size INTEGER,
+        fitness REAL,           -- NULL: the simulation failed (raised or returned no fitness)
+        faults TEXT,            -- space separated, as in case_states.log
+        generation INTEGER,     -- global generation (steady-state: epoch), -1 for the initial population
+        parent_id TEXT,         -- scenario the genome was edited from
+        record_path TEXT,
+        submitted REAL,         -- unix times
+        started REAL,
+        finished REAL,
+        timings TEXT,           -- json of the readiness waits of the run
+        cached_from TEXT        -- fitness cache hit: scenario id of the run the result was served from
+    )''',
+    '''CREATE TABLE IF NOT EXISTS faults (
+        scenario_id TEXT,
+        fault TEXT,
+        PRIMARY KEY (fault, scenario_id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS runs_fitness ON runs (fitness)',
+    'CREATE INDEX IF NOT EXISTS runs_generation ON runs (generation)',
+    'CREATE INDEX IF NOT EXISTS faults_scenario ON faults (scenario_id)'
+]
+
+COLUMNS = ('scenario_id', 'genome', 'npc_size', 'time_size', 'fitness', 'faults', 'generation', 'parent_id', 'record_path', 'submitted', 'started', 'finished', 'timings', 'cached_from')
+
+class ResultsDB(object):
+    """
+    SQLite (WAL) store of every simulated scenario, one row per run, so results are queried instead of
+    unpickling simulation/results/*.obj one by one. Faults also go to a (fault, scenario_id) table for
+    fault type queries. Rows are buffered and inserted batch_size at a time (or after flush_interval seconds)
+    in one transaction. A scenario id simulated again (e.g. after a resume) replaces its row.
+    """
+
+    def __init__(self, db_file, batch_size=32, flush_interval=5.0, readonly=False):
+        self.db_file = db_file
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_flush = time.time()
+
+        if readonly:
+            self.conn = sqlite3.connect('file:' + db_file + '?mode=ro', uri=True, check_same_thread=False)
+            return
+        db_folder = os.path.dirname(db_file)
+        if db_folder and not os.path.exists(db_folder):
+            os.makedirs(db_folder)
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            for statement in SCHEMA:
+                self.conn.execute(statement)
+            # stores created before a column was added
+            existing = [row[1] for row in self.conn.execute('PRAGMA table_info(runs)').fetchall()]
+            for column in COLUMNS:
+                if column not in existing:
+                    self.conn.execute('ALTER TABLE runs ADD COLUMN ' + column)
+
+    def add(self, scenario_id, scenario_data, fitness, faults, generation=None, parent_id=None, record_path=None, submitted=None, started=None, finished=None, timings=None, cached_from=None):
+        genome = np.asarray(scenario_data, dtype=float)
+        row = (str(scenario_id),
+               sqlite3.Binary(genome.tobytes()),
+               genome.shape[0],
+               genome.shape[1],
+               None if fitness is None else float(fitness),
+               ' '.join(str(fault) for fault in faults),
+               generation,
+               None if parent_id is None else str(parent_id),
+               record_path,
+               submitted,
+               started,
+               finished,
+               json.dumps(timings) if timings is not None else None,
+               cached_from)
+        with self._lock:
+            self._pending.append((row, [str(fault) for fault in faults]))
+            if len(self._pending) >= self.batch_size or time.time() - self._last_flush >= self.flush_interval:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        self._last_flush = time.time()
+        if len(self._pending) == 0:
+            return
+        rows = [row for row, _ in self._pending]
+        ids = [(row[0],) for row in rows]
+        fault_rows = [(row[0], fault) for row, faults in self._pending for fault in set(faults)]
+        with self.conn:
+            self.conn.executemany('DELETE FROM faults WHERE scenario_id = ?', ids)
+            self.conn.executemany('INSERT OR REPLACE INTO runs VALUES (' + ', '.join(['?'] * len(COLUMNS)) + ')', rows)
+            self.conn.executemany('INSERT OR IGNORE INTO faults VALUES (?, ?)', fault_rows)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def query(self, min_fitness=None, max_fitness=None, faults=None, generation=None, order='fitness', limit=None, columns=None):
+        """
+        Rows (dicts) with fitness in [min_fitness, max_fitness], any of the fault types, of one generation,
+        ordered by a column ('-' prefix: descending)
+        """
+        columns = list(columns) if columns else [column for column in COLUMNS if column != 'genome']
+        sql = 'SELECT ' + ', '.join(columns) + ' FROM runs'
+        conditions = []
+        params = []
+        if min_fitness is not None:
+            conditions.append('fitness >= ?')
+            params.append(min_fitness)
+        if max_fitness is not None:
+            conditions.append('fitness <= ?')
+            params.append(max_fitness)
+        if faults:
+            conditions.append('scenario_id IN (SELECT scenario_id FROM faults WHERE fault IN (' + ', '.join(['?'] * len(faults)) + '))')
+            params.extend(faults)
+        if generation is not None:
+            conditions.append('generation = ?')
+            params.append(generation)
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        if order:
+            descending = order.startswith('-')
+            column = order.lstrip('-')
+            if column not in COLUMNS:
+                raise RuntimeError('Results can be ordered by: ' + ', '.join(COLUMNS) + '.')
+            sql += ' ORDER BY ' + column + (' DESC' if descending else ' ASC')
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self._lock:
+            cursor = self.conn.execute(sql, params)
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    @staticmethod
+    def genome(row):
+        """
+        (npc_size, time_size, 2) array of a row queried with the genome, npc_size and time_size columns
+        """
+        return np.frombuffer(row['genome'], dtype=float).reshape(row['npc_size'], row['time_size'], 2)
+
+    def fault_counts(self):
+        with self._lock:
+            return dict(self.conn.execute('SELECT fault, COUNT(*) FROM faults GROUP BY fault').fetchall())
+
+def query_main(argv):
+    """
+    python -m simulation.results_db <results.db> [filters]: print matching runs, tab separated
+    """
+    parser = argparse.ArgumentParser(prog='python -m simulation.results_db', description='Query the simulation results of a campaign.')
+    parser.add_argument('db', type=str, help='results.db of a campaign (output_path/logs/results.db).')
+    parser.add_argument('--min-fitness', type=float, default=None)
+    parser.add_argument('--max-fitness', type=float, default=None)
+    parser.add_argument('--fault', type=str, action='append', help='Fault type, e.g. ego_fault, repeat for any of several.')
+    parser.add_argument('--generation', type=int, default=None)
+    parser.add_argument('--order', type=str, default='-fitness', help='Column to order by, - prefix for descending.')
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--counts', action='store_true', help='Only print the number of runs per fault type.')
+    args = parser.parse_args(argv[1:])
+
+    db = ResultsDB(args.db, readonly=True)
+    if args.counts:
+        for fault, count in sorted(db.fault_counts().items()):
+            print(fault + '\t' + str(count))
+        return 0
+
+    columns = ['scenario_id', 'fitness', 'faults', 'generation', 'parent_id', 'record_path']
+    rows = db.query(args.min_fitness, args.max_fitness, args.fault, args.generation, args.order, args.limit, columns)
+    print('\t'.join(columns))
+    for row in rows:
+        print('\t'.join('' if row[column] is None else str(row[column]) for column in columns))
+    logger.info(str(len(rows)) + ' runs')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(query_main(sys.argv))
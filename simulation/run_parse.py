@@ -1,11 +1,20 @@
 import os
 import math
+import time
 import pickle
 import shutil
+import threading
+import collections
+
+from concurrent.futures import Future
 
 #TODO: how to extract this file from apollo or is that neccessary? 
 from loguru import logger
 from simulation.simulator import Simulator
+from simulation.worker_pool import SimulatorPool
+from simulation.fitness_cache import FitnessCache
+from simulation.results_db import ResultsDB
+from corpus.events import open_log, close_log
 
 def isNaN(i_):
     return math.isnan(i_)
@@ -26,14 +35,21 @@ def clear_and_create(folder_path):
 
 class Runner(object):
 
-    def __init__(self, scenario_env_json, output_path, total_sim_time, default_record_folder, lgsvl_map = 'SanFrancisco_correct', apollo_map = 'SanFrancisco'):
+    def __init__(self, scenario_env_json, output_path, total_sim_time, default_record_folder, lgsvl_map = 'SanFrancisco_correct', apollo_map = 'SanFrancisco', simulator_cfgs = None, cache_cfgs = None, run_cfgs = None, resume = False, db_cfgs = None, trajectory_cfgs = None):
         self.global_id = 0
+        self._lock = threading.RLock()
+        self._submitted = collections.deque() # scenario ids in submission order, not yet logged
+        self._finished = {} # scenario_id -> sim_result, waiting for earlier ids to be logged
+        self._inflight = {} # cache key -> {future, scenario_id, fault} of a scenario being simulated
+        self._listeners = [] # fn(scenario_data, fitness) called after every simulated scenario
+        self._meta = {} # scenario_id -> results db fields known before the simulation ends
         self.scenario_env_json = scenario_env_json
         self.scenario_name = os.path.basename(scenario_env_json).split('.')[0]
 
         self.SCENARIO_FOLDER = 'scenarios'
         self.RESULT_FOLDER = 'results'
         self.RECORD_FOLDER = 'records'
+        self.TRAJECTORY_FOLDER = 'trajectories'
 
         self.default_record_folder = default_record_folder
         logger.info('Default record path: ' + str(self.default_record_folder))
@@ -41,69 +57,310 @@ class Runner(object):
         self.scenario_path = os.path.join(output_path, 'simulation', self.SCENARIO_FOLDER)
         self.result_path = os.path.join(output_path, 'simulation', self.RESULT_FOLDER)
         self.record_path = os.path.join(output_path, 'simulation', self.RECORD_FOLDER)
+        self.trajectory_path = None
+        folders = [self.scenario_path, self.result_path, self.record_path]
+        if trajectory_cfgs and trajectory_cfgs.get('enabled', False):
+            self.trajectory_path = os.path.join(output_path, 'simulation', self.TRAJECTORY_FOLDER)
+            folders.append(self.trajectory_path)
+
+        # a resumed campaign keeps the files of the scenarios simulated before the crash
+        for folder_path in folders:
+            if resume:
+                os.makedirs(folder_path, exist_ok=True)
+            else:
+                clear_and_create(folder_path)
+        if resume:
+            self.global_id = self.next_free_id()
 
-        clear_and_create(self.scenario_path)
-        clear_and_create(self.result_path)
-        clear_and_create(self.record_path)
+        # one Simulator per configured LGSVL/Apollo pair, default is a single local worker
+        if not simulator_cfgs:
+            simulator_cfgs = [{}]
+        simulators = []
+        for sim_cfg in simulator_cfgs:
+            sim = Simulator(sim_cfg.get('default_record_folder', self.default_record_folder),
+                            self.record_path,
+                            total_sim_time,
+                            lgsvl_map,
+                            apollo_map,
+                            sim_host=sim_cfg.get('sim_host'),
+                            sim_port=sim_cfg.get('sim_port', 8181),
+                            bridge_host=sim_cfg.get('bridge_host', '127.0.0.1'),
+                            bridge_port=sim_cfg.get('bridge_port', 9090),
+                            dreamview_host=sim_cfg.get('dreamview_host'),
+                            dreamview_port=sim_cfg.get('dreamview_port', 8888),
+                            run_cfgs=run_cfgs,
+                            trajectory_folder=self.trajectory_path) # save record to records/scenario_name/scenario_id
+            simulators.append(sim)
+        self.pool = SimulatorPool(simulators)
 
-        self.sim = Simulator(self.default_record_folder, self.record_path, total_sim_time, lgsvl_map, apollo_map) # save record to records/scenario_name/scenario_id
+        # fitness memoization, keyed by scenario content
+        self.cache = None
+        if cache_cfgs and cache_cfgs.get('enabled', False):
+            # everything that changes the score of a scenario, runs with other stop rules or steps are not reused
+            scoring_cfgs = run_cfgs if run_cfgs else {}
+            sim_params = {
+                'total_sim_time': total_sim_time,
+                'lgsvl_map': lgsvl_map,
+                'apollo_map': apollo_map,
+                'stop_rules': scoring_cfgs.get('stop_rules') or {},
+                'adaptive_step': scoring_cfgs.get('adaptive_step') or {}
+            }
+            self.cache = FitnessCache(cache_cfgs.get('path', os.path.join(output_path, 'fitness_cache.pkl')),
+                                      scenario_env_json,
+                                      sim_params,
+                                      cache_cfgs.get('max_entries', 10000),
+                                      cache_cfgs.get('resample', 1),
+                                      cache_cfgs.get('save_every', 20))
         
+        # case_states.log is a view of the event log
+        self.log_path = os.path.join(output_path, 'logs')
+        self.events = open_log(self.log_path)
         self.runner_log = os.path.join(output_path, 'logs/case_states.log')
-        if os.path.exists(self.runner_log):
+        if os.path.exists(self.runner_log) and not resume:
             os.remove(self.runner_log)
 
-    def run(self, scenario_data):
-        scenario_id = 'scenario_' + str(self.global_id)
-        sim_result = self._run_scenario(scenario_id, scenario_data)
-        if sim_result is None:
+        # one row per simulated scenario, written in submission order with case_states.log
+        self.db = None
+        if db_cfgs is None or db_cfgs.get('enabled', True):
+            db_cfgs = db_cfgs if db_cfgs else {}
+            db_file = db_cfgs.get('path') or os.path.join(output_path, 'logs/results.db')
+            if os.path.exists(db_file) and not resume:
+                for suffix in ['', '-wal', '-shm']:
+                    if os.path.exists(db_file + suffix):
+                        os.remove(db_file + suffix)
+            self.db = ResultsDB(db_file, db_cfgs.get('batch_size', 32), db_cfgs.get('flush_interval', 5.0))
+
+    def next_free_id(self):
+        """
+        Number after the highest scenario id written to simulation/scenarios, every started run writes its file first.
+        A resumed campaign continues from there: ids of the runs after its last saved state are not reused,
+        their records/<id> folders and pickles stay as they are.
+        """
+        next_id = 0
+        for file_name in os.listdir(self.scenario_path):
+            name, ext = os.path.splitext(file_name)
+            if ext == '.obj' and name.startswith('scenario_') and name[len('scenario_'):].isdigit():
+                next_id = max(next_id, int(name[len('scenario_'):]) + 1)
+        return next_id
+
+    def add_result_listener(self, listener):
+        """
+        listener(scenario_data, fitness) is called from the worker thread after each simulated (not cached) scenario
+        """
+        self._listeners.append(listener)
+
+    def run(self, scenario_data, generation=None, parent_id=None):
+        return self.submit(scenario_data, generation, parent_id).result()
+
+    def run_batch(self, scenario_list, generation=None, parent_ids=None):
+        """
+        Simulate scenarios concurrently, returns [(fitness, scenario_id)] in list order.
+        generation and parent_ids (one per scenario) only go to the results db.
+        """
+        if parent_ids is None:
+            parent_ids = [None] * len(scenario_list)
+        futures = [self.submit(scenario_data, generation, parent_id) for scenario_data, parent_id in zip(scenario_list, parent_ids)]
+        outputs = [future.result() for future in futures]
+        if self.cache is not None:
+            logger.info(' === Fitness cache: ' + self.cache.stats())
+        return outputs
+
+    def submit(self, scenario_data, generation=None, parent_id=None):
+        """
+        Queue one scenario on the simulator pool.
+        Returns a Future of (fitness, scenario_id), resolved as soon as the simulation ends.
+        Scenario ids follow submission order and case_states.log is written in the same order.
+        A scenario found in the fitness cache, or identical to one being simulated, is not simulated.
+        It still gets its own id of this campaign, scenario and result files, a case state and a results db row
+        (cached_from: id of the run it was served from, possibly of another campaign sharing the cache file).
+        """
+        cache_key = None
+        cached = None
+        inflight = None
+        with self._lock:
+            if self.cache is not None:
+                cache_key = self.cache.key(scenario_data)
+                cached = self.cache.get(cache_key)
+                # identical scenario already queued, served from its result once it ends
+                if cached is None and self.cache.resample == 1:
+                    inflight = self._inflight.get(cache_key)
+
+            scenario_id = 'scenario_' + str(self.global_id)
+            self.global_id += 1
+            self._submitted.append(scenario_id)
+            self._meta[scenario_id] = {
+                'scenario_data': scenario_data,
+                'generation': generation,
+                'parent_id': parent_id,
+                'submitted': time.time()
+            }
+
+            future = Future()
+            if cached is None and inflight is None and cache_key is not None:
+                self._inflight[cache_key] = {'future': future, 'scenario_id': scenario_id, 'fault': None}
+
+        if cached is not None:
+            fitness, fault, cached_id = cached
+            self._serve_cached(scenario_id, scenario_data, future, fitness, fault, cached_id)
+            return future
+
+        if inflight is not None:
+            logger.info(' === ' + scenario_id + ' waits for the identical ' + inflight['scenario_id'])
+            inflight['future'].add_done_callback(lambda original: self._on_inflight_done(scenario_id, scenario_data, future, inflight, original))
+            return future
+
+        job = self.pool.submit(self._run_scenario, scenario_id, scenario_data)
+        job.add_done_callback(lambda job: self._on_job_done(scenario_id, job, future, cache_key, scenario_data))
+        return future
+
+    def _serve_cached(self, scenario_id, scenario_data, future, fitness, fault, cached_id):
+        logger.info(' === Fitness cache hit: ' + scenario_id + ' served from ' + cached_id + ', fitness ' + str(fitness) + ' fault ' + str(fault))
+        sim_result = {'fitness': fitness, 'fault': list(fault), 'cached_from': cached_id}
+        self._save_scenario(scenario_id, scenario_data)
+        self._save_result(scenario_id, sim_result)
+        self.events.emit('cache_hit', scenario_id=scenario_id, cached_from=cached_id, fitness=fitness)
+        future.set_result((fitness, scenario_id))
+        self._finish(scenario_id, sim_result)
+
+    def _on_inflight_done(self, scenario_id, scenario_data, future, inflight, original):
+        try:
+            fitness, original_id = original.result()
+        except Exception as e:
+            logger.error('Simulation of ' + scenario_id + ' failed with the identical ' + inflight['scenario_id'] + ': ' + str(e))
+            future.set_exception(RuntimeError('sim_result of ' + scenario_id + ' is None'))
+            self._finish(scenario_id, None)
+            return
+        self._serve_cached(scenario_id, scenario_data, future, fitness, inflight['fault'], original_id)
+
+    def _on_job_done(self, scenario_id, job, future, cache_key=None, scenario_data=None):
+        try:
+            sim_result = job.result()
+        except Exception as e:
+            sim_result = None
+            logger.error('Simulation of ' + scenario_id + ' failed: ' + str(e))
+
+        if sim_result is None or 'fitness' not in sim_result:
             print('sim_result is None, ERROR')
-            exit(-1)
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+            future.set_exception(RuntimeError('sim_result of ' + scenario_id + ' is None'))
+        else:
+            logger.info(' === Simulation Result: ' + str(sim_result))
+            fitness = float(sim_result['fitness'])
+            if cache_key is not None:
+                fitness = self.cache.put(cache_key, fitness, sim_result['fault'], scenario_id)
+                with self._lock:
+                    inflight = self._inflight.pop(cache_key, None)
+                if inflight is not None:
+                    inflight['fault'] = list(sim_result['fault']) # read by the identical scenarios waiting on future
+            for listener in self._listeners:
+                try:
+                    listener(scenario_data, fitness)
+                except Exception as e:
+                    logger.error('Result listener failed on ' + scenario_id + ': ' + str(e))
+            future.set_result((fitness, scenario_id))
+
+        self._finish(scenario_id, sim_result)
+
+    def _finish(self, scenario_id, sim_result):
+        with self._lock:
+            self._finished[scenario_id] = sim_result
+            # keep case_states.log in submission order
+            while len(self._submitted) > 0 and self._submitted[0] in self._finished:
+                done_id = self._submitted.popleft()
+                done_result = self._finished.pop(done_id)
+                if done_result is not None:
+                    self._record_result(done_id, done_result)
+                else:
+                    self._record_failure(done_id)
+
+    def _record_result(self, scenario_id, sim_result):
         # TODO: add test log, to record test results.
-        
         sim_fault = sim_result['fault']
-        with open(self.runner_log, 'a') as f:
-            f.write(str(scenario_id))
-            for item in sim_fault:
-                f.write(' ')
-                f.write(str(item))
-            f.write('\n')
+        self.events.emit('case_state', scenario_id=str(scenario_id), faults=[str(item) for item in sim_fault])
         
-       
-        self.global_id += 1
-        logger.info(' === Simulation Result: ' + str(sim_result))
         logger.info(' === Record ' + scenario_id + ' to ' + self.runner_log)
-        return float(sim_result['fitness']), scenario_id
 
-    def _run_scenario(self, scenario_id, scenario_data):
+        meta = self._meta.pop(scenario_id, None)
+        if self.db is not None and meta is not None:
+            record_path = os.path.join(self.record_path, scenario_id)
+            self.db.add(scenario_id,
+                        meta['scenario_data'],
+                        sim_result.get('fitness'),
+                        sim_fault if isinstance(sim_fault, list) else [],
+                        meta['generation'],
+                        meta['parent_id'],
+                        record_path if os.path.isdir(record_path) else None,
+                        meta['submitted'],
+                        meta.get('started'),
+                        meta.get('finished'),
+                        sim_result.get('timings'),
+                        sim_result.get('cached_from'))
+
+    def _record_failure(self, scenario_id):
+        # no case state, a results db row with NULL fitness
+        meta = self._meta.pop(scenario_id, None)
+        if self.db is not None and meta is not None:
+            self.db.add(scenario_id,
+                        meta['scenario_data'],
+                        None,
+                        [],
+                        meta['generation'],
+                        meta['parent_id'],
+                        None,
+                        meta['submitted'],
+                        meta.get('started'),
+                        meta.get('finished'))
+
+    def close(self):
+        self.pool.shutdown()
+        if self.db is not None:
+            self.db.close()
+        close_log(self.log_path)
+        if self.cache is not None:
+            self.cache.flush()
+            logger.info('Fitness cache: ' + self.cache.stats())
+
+    def _run_scenario(self, sim, scenario_id, scenario_data):
         """
         run elements:
         save - recording, json config
         save scenario config to scenario_name/scenarios/scenario_id
         save results to scenario_name/results/scenario_id
         """
-        scenario_file = os.path.join(self.scenario_path, scenario_id + '.obj')
-        with open(scenario_file, 'wb') as s_f:
-            pickle.dump(scenario_data, s_f)
-
-        result_file = os.path.join(self.result_path, scenario_id + '.obj')
-
-        if os.path.isfile(result_file):
-            os.remove(result_file)
+        meta = self._meta.get(scenario_id, {})
+        meta['started'] = time.time()
+        self._save_scenario(scenario_id, scenario_data)
 
         # replace simulator codes
         resultDic = {}
         try:
-            resultDic = self.sim.runSimulation(scenario_data, self.scenario_env_json, scenario_id)
+            resultDic = sim.runSimulation(scenario_data, self.scenario_env_json, scenario_id)
         except Exception as e:
-            logger.debug(e.message)
+            logger.debug(str(e))
             #resultDic['fitness'] = ''
             resultDic['fault'] = ''
 
+        meta['finished'] = time.time()
+
         # Send fitness score int object back to ge
-        if os.path.isfile(result_file):
-            os.system("rm " + result_file)
-        with open(result_file, 'wb') as f_f:
-            pickle.dump(resultDic, f_f)
+        self._save_result(scenario_id, resultDic)
 
         return resultDic
+
+    def _save_scenario(self, scenario_id, scenario_data):
+        scenario_file = os.path.join(self.scenario_path, scenario_id + '.obj')
+        with open(scenario_file, 'wb') as s_f:
+            pickle.dump(scenario_data, s_f)
+
+        result_file = os.path.join(self.result_path, scenario_id + '.obj')
+        if os.path.isfile(result_file):
+            os.remove(result_file)
+
+    def _save_result(self, scenario_id, resultDic):
+        # replaced atomically
+        result_file = os.path.join(self.result_path, scenario_id + '.obj')
+        with open(result_file + '.tmp', 'wb') as f_f:
+            pickle.dump(resultDic, f_f)
+        os.replace(result_file + '.tmp', result_file)
     
\ No newline at end of file
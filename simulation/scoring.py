@@ -0,0 +1,134 @@
+import math
+import numpy as np
+
+import simulation.liability as liability
+
+class OnlineScorer(object):
+    """
+    Incremental danger fitness and line faults over a TrajectoryRecorder.
+    update() is called after every recorded frame, scoring lags one frame behind the recording
+    so that finish() gives the same frames as scoring the whole run afterwards.
+    sweep_step: line faults are also checked on ego poses interpolated every sweep_step seconds between
+    frames further apart (adaptive coarse steps), a touch inside a step counts for the frame it starts at.
+
+    stop_rules:
+        collision: stop once the collision callback fired
+        destination: stop when ego is within this distance (m) of the destination and stopped
+        npcs_passed: stop when every npc is behind ego by more than this distance (m)
+    """
+
+    def __init__(self, recorder, npc_names, yellow_lines, edge_lines, destination=None, stop_rules=None, sweep_step=None):
+        self.recorder = recorder
+        self.npc_names = npc_names
+        self.yellow_lines = yellow_lines
+        self.edge_lines = edge_lines
+        self.destination = destination # (x, z)
+        self.stop_rules = stop_rules if stop_rules else {}
+        self.sweep_step = sweep_step
+
+        self.ego_extents = recorder.half_extents('ego')
+        self.npc_extents = [recorder.half_extents(name) for name in npc_names]
+
+        self.max_fitness = -1111
+        self.fault = []
+        self.scored = 0 # number of frames scored
+
+    def update(self):
+        end = self.recorder.size - 1
+        if end <= self.scored:
+            return
+        start = self.scored
+
+        ego_traj = self.recorder.trajectory('ego', start, end)
+        for name, extents in zip(self.npc_names, self.npc_extents):
+            npc_traj = self.recorder.trajectory(name, start, end)
+            npc_distances, npc_speeds = liability.get_distance_and_speed_batch(ego_traj, self.ego_extents, npc_traj, extents)
+            npc_fitness = npc_speeds / (npc_distances + 1) ** 2
+            if npc_fitness.max() > self.max_fitness:
+                self.max_fitness = float(npc_fitness.max())
+
+        sweep_traj, sweep_starts = self._ego_sweep(start, end)
+        yellow_line_hits = [np.logical_or.reduceat(liability.obb_line_hits(sweep_traj, self.ego_extents, line), sweep_starts) for line in self.yellow_lines]
+        edge_line_hits = [np.logical_or.reduceat(liability.obb_line_hits(sweep_traj, self.ego_extents, line), sweep_starts) for line in self.edge_lines]
+        for t in range(end - start):
+            for hit_yellow_line in yellow_line_hits:
+                if hit_yellow_line[t]:
+                    self.fault.append('hit_yellow_line')
+            for hit_edge_line in edge_line_hits:
+                if hit_edge_line[t]:
+                    self.fault.append('hit_edge_line')
+
+        self.scored = end
+
+    def _ego_sweep(self, start, end):
+        """
+        Ego poses of frames start:end, plus poses interpolated every sweep_step seconds up to the next frame.
+        Returns (positions, headings, velocities) and the index of the first pose of every frame.
+        """
+        if self.sweep_step is None:
+            return self.recorder.trajectory('ego', start, end), np.arange(end - start)
+        positions, headings, velocities = self.recorder.trajectory('ego', start, end + 1)
+        steps = np.diff(self.recorder.times[start:end + 1])
+        substeps = np.maximum(1, np.ceil(steps / self.sweep_step - 1e-6).astype(int))
+        frame_of = np.repeat(np.arange(end - start), substeps)
+        sweep_starts = np.cumsum(substeps) - substeps
+        fraction = (np.arange(len(frame_of)) - sweep_starts[frame_of]) / substeps[frame_of]
+        turn = (headings[1:] - headings[:-1] + 180.0) % 360.0 - 180.0
+        sweep_positions = positions[frame_of] + fraction[:, None] * (positions[frame_of + 1] - positions[frame_of])
+        sweep_headings = headings[frame_of] + fraction * turn[frame_of]
+        return (sweep_positions, sweep_headings, velocities[frame_of]), sweep_starts
+
+    def current_gap(self, others=None):
+        """
+        (min ego-npc distance, max ego-npc relative speed) of the latest recorded frame
+        others: [(trajectory, half extents)] of agents that are not recorded (fixed npcs), one frame each
+        """
+        last = self.recorder.size - 1
+        ego_traj = self.recorder.trajectory('ego', last, last + 1)
+        min_distance = math.inf
+        max_speed = 0.0
+        agents = [(self.recorder.trajectory(name, last, last + 1), extents) for name, extents in zip(self.npc_names, self.npc_extents)]
+        if others:
+            agents.extend(others)
+        for npc_traj, extents in agents:
+            distances, speeds = liability.get_distance_and_speed_batch(ego_traj, self.ego_extents, npc_traj, extents)
+            min_distance = min(min_distance, float(distances[0]))
+            max_speed = max(max_speed, float(speeds[0]))
+        return min_distance, max_speed
+
+    def stop_reason(self, accident_happen):
+        """
+        Returns the name of the first matched stop rule, or None to keep running
+        """
+        if self.stop_rules.get('collision', False) and accident_happen:
+            return 'collision'
+
+        frame = self.recorder.frames[self.recorder.size - 1]
+        ego = frame[self.recorder.agent_index['ego']]
+        ego_x, ego_z = ego['position'][0], ego['position'][2]
+
+        destination_radius = self.stop_rules.get('destination', False)
+        if destination_radius and self.destination is not None:
+            to_destination = math.hypot(self.destination[0] - ego_x, self.destination[1] - ego_z)
+            if to_destination <= destination_radius and np.linalg.norm(ego['velocity']) <= 0.1:
+                return 'destination'
+
+        passed_distance = self.stop_rules.get('npcs_passed', False)
+        if passed_distance and len(self.npc_names) > 0:
+            # longitudinal offset along ego heading, same convention as liability.ego_npc_direction
+            theta = math.radians(ego['rotation'][1])
+            all_passed = True
+            for name in self.npc_names:
+                npc = frame[self.recorder.agent_index[name]]
+                d = math.sin(theta) * (npc['position'][0] - ego_x) + math.cos(theta) * (npc['position'][2] - ego_z)
+                if d >= -passed_distance:
+                    all_passed = False
+                    break
+            if all_passed:
+                return 'npcs_passed'
+
+        return None
+
+    def finish(self):
+        self.update()
+        return self.max_fitness, self.fault
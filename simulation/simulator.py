@@ -6,6 +6,11 @@ import json
 import simulation.utils as util
 import simulation.liability as liability
 
+from simulation.recorder import TrajectoryRecorder
+from simulation.apollo_session import ApolloSession
+from simulation.readiness import ReadinessWaiter
+from simulation.scoring import OnlineScorer
+
 from datetime import datetime
 from loguru import logger
 
@@ -13,26 +18,54 @@ EGO_VEHICLE_ID = '2e966a70-4a19-44b5-a5e7-64e00a7bc5de'
 
 class Simulator(object):
 
-    def __init__(self, default_record_folder, target_record_folder, total_sim_time, lgsvl_map = 'SanFrancisco_correct', apollo_map = 'SanFrancisco'):
+    def __init__(self, default_record_folder, target_record_folder, total_sim_time, lgsvl_map = 'SanFrancisco_correct', apollo_map = 'SanFrancisco', sim_host = None, sim_port = 8181, bridge_host = '127.0.0.1', bridge_port = 9090, dreamview_host = None, dreamview_port = 8888, run_cfgs = None, trajectory_folder = None):
         
+        self.run_cfgs = run_cfgs if run_cfgs else {}
+        self.stop_rules = self.run_cfgs.get('stop_rules') or {}
+        self.status_max_age = self.run_cfgs.get('status_max_age', 2.0) # seconds a cached dreamview status stays valid
+        self.readiness_cfgs = self.run_cfgs.get('readiness') or {}
+        self.module_timeout = self.readiness_cfgs.get('module_timeout', 10.0)
+        self.module_restarts = self.readiness_cfgs.get('module_restarts', 3) # restart attempts before the run fails
+        self.recorder_timeout = self.readiness_cfgs.get('recorder_timeout', 10.0)
+        self.routing_timeout = self.readiness_cfgs.get('routing_timeout', 10.0)
+        self.settle_time = self.readiness_cfgs.get('settle_time', 0.0) # fixed extra wait after routing, 0 to rely on readiness only
+        # adaptive stepping: coarse steps while all npcs (mutated and fixed) are far from ego
+        self.adaptive_cfgs = self.run_cfgs.get('adaptive_step') or {}
+        self.adaptive_step = self.adaptive_cfgs.get('enabled', False)
+        self.fine_step = self.adaptive_cfgs.get('fine_step', 0.1)
+        self.coarse_step = self.adaptive_cfgs.get('coarse_step', 1.0)
+        self.near_distance = self.adaptive_cfgs.get('near_distance', 20.0)
+        self.sim_host = sim_host if sim_host else os.environ.get("SIMULATOR_HOST", "127.0.0.1")
+        self.sim_port = sim_port
+        self.bridge_host = bridge_host
+        self.bridge_port = bridge_port
+        self.dreamview_host = dreamview_host if dreamview_host else os.environ.get("BRIDGE_HOST", "127.0.0.1")
+        self.dreamview_port = dreamview_port
+
         self.default_record_folder = default_record_folder
         self.target_record_folder = target_record_folder
+        self.trajectory_folder = trajectory_folder # None: the recording is dropped after scoring
         ################################################################
         self.total_sim_time = total_sim_time
         self.destination = None
         ################################################################
         self.sim = None
         self.data_prime = None
-        self.dv = None
         self.lgsvl_map = lgsvl_map
         self.apollo_map = apollo_map
         self.ego = None
         self.mutated_npc_list = [] # The list contains all the npc added
         self.fixed_npc_list = []
+        self.fixed_npc_extents = []
         self.yellow_lines = None
         self.cross_lines = None
         self.edge_lines = None
 
+        # collision state, written by the on_collision callback of the current run
+        self.collision_info = None
+        self.accident_happen = False
+        self.time_index = 0
+
         self.connect_lgsvl()
         self.load_map(self.lgsvl_map)
         self.isEgoFault = False
@@ -53,14 +86,26 @@ class Simulator(object):
             'Recorder',
         ]
 
+        # dreamview connection and configured apollo, reused across runs
+        self.apollo_session = ApolloSession(self.sim,
+                                            self.dreamview_host,
+                                            self.dreamview_port,
+                                            self.apollo_map,
+                                            'Lincoln2017MKZ_LGSVL',
+                                            self.modules,
+                                            self.status_max_age,
+                                            self.run_cfgs.get('warm_apollo', True),
+                                            self.readiness_cfgs.get('control_timeout', 10.0))
+
     def connect_lgsvl(self):
+        address = self.sim_host + ':' + str(self.sim_port)
         try:
-            sim = lgsvl.Simulator(os.environ.get("SIMULATOR_HOST", "127.0.0.1"), 8181) 
+            sim = lgsvl.Simulator(self.sim_host, self.sim_port) 
             self.sim = sim
         except Exception as e:
-            logger.error('Connect LGSVL wrong: ' + '127.0.0.1:8181')
-            logger.error(e.message)
-        logger.info('Connected LGSVL 127.0.0.1:8181')
+            logger.error('Connect LGSVL wrong: ' + address)
+            logger.error(str(e))
+        logger.info('Connected LGSVL ' + address)
 
     def load_map(self, mapName="SanFrancisco_correct"):
         if self.sim.current_scene == mapName:
@@ -158,7 +203,32 @@ class Simulator(object):
         self.cross_lines = self.data_prime['lines']['cross_lines']
         self.edge_lines = self.data_prime['lines']['edge_lines']
 
+    def close(self):
+        self.apollo_session.close()
+
+    def next_step_ms(self, scorer):
+        """
+        Length of the next sim.run step: 0.1s by default,
+        in adaptive mode coarse_step while no mutated or fixed npc can come within near_distance of ego during the step.
+        Yellow/edge line touches inside a coarse step are found by the scorer, which sweeps the ego path at fine_step.
+        """
+        if not self.adaptive_step:
+            return 100
+        fixed_npcs = [(liability.stack_states([npc.state]), extents) for npc, extents in zip(self.fixed_npc_list, self.fixed_npc_extents)]
+        min_distance, max_speed = scorer.current_gap(fixed_npcs)
+        if min_distance > self.near_distance + max_speed * self.coarse_step:
+            return int(round(self.coarse_step * 1000))
+        return int(round(self.fine_step * 1000))
+
     def runSimulation(self, scenario_obj, json_file, case_id):
+        try:
+            return self._run_simulation(scenario_obj, json_file, case_id)
+        except Exception:
+            # apollo may be left in any state, set it up from scratch next time
+            self.apollo_session.invalidate()
+            raise
+
+    def _run_simulation(self, scenario_obj, json_file, case_id):
 
         #exit_handler()
         now = datetime.now()
@@ -173,31 +243,24 @@ class Simulator(object):
 
         assert mutated_npc_num == len(self.mutated_npc_list)
 
-        # simulation info
-        simulation_recording = {
-            'bbox': {
-                'ego' : self.ego.bounding_box
-            },
-            'frames': {
+        # Frequency of action change of NPCs
+        total_sim_time = self.total_sim_time
+        action_change_freq = total_sim_time / time_slice_size
 
-            }
-        }
-        for npc_i in range(mutated_npc_num):
-            simulation_recording['bbox']['npc_' + str(npc_i)] = self.mutated_npc_list[npc_i].bounding_box
-        
-        global collision_info
-        global accident_happen
-        global time_index
+        # simulation info
+        agent_names = ['ego'] + ['npc_' + str(npc_i) for npc_i in range(mutated_npc_num)]
+        recorded_agents = [self.ego] + self.mutated_npc_list
+        min_step = self.fine_step if self.adaptive_step else 0.1
+        simulation_recording = TrajectoryRecorder(agent_names, int(time_slice_size * int(action_change_freq) / min_step) + 1)
+        for name, agent in zip(agent_names, recorded_agents):
+            simulation_recording.set_bbox(name, agent.bounding_box)
+        self.fixed_npc_extents = [liability.bbox_half_extents(npc.bounding_box) for npc in self.fixed_npc_list]
         
-        collision_info = None
-        accident_happen = False
+        self.collision_info = None
+        self.accident_happen = False
 
         def on_collision(agent1, agent2, contact):
-            global accident_happen
-            global collision_info
-            global time_index
-
-            accident_happen = True
+            self.accident_happen = True
             collision_info = {}
 
             name1 = "STATIC OBSTACLE" if agent1 is None else agent1.name
@@ -211,46 +274,57 @@ class Simulator(object):
             else:
                 agent2_info = [agent2.state, agent2.bounding_box]
             
+            contact_loc = None
             if contact:
                 contact_loc = [contact.x, contact.y, contact.z]
             
-            collision_info['time'] = time_index
+            collision_info['time'] = self.time_index
             collision_info['ego'] = agent1_info
             collision_info['npc'] = agent2_info
             collision_info['contact'] = contact_loc
+            collision_info['agents'] = [name1, name2]
+            self.collision_info = collision_info
 
             self.sim.stop()
         
         # INIT apollo      
-        self.ego.connect_bridge(address='127.0.0.1', port=9090) #address, port
+        self.ego.connect_bridge(address=self.bridge_host, port=self.bridge_port) #address, port
         self.ego.on_collision(on_collision)
         
-        times = 0
-        success = False
-        while times < 3:
-            try:
-                dv = lgsvl.dreamview.Connection(self.sim, self.ego, os.environ.get("BRIDGE_HOST", "127.0.0.1"))
-                dv.set_hd_map(self.apollo_map)
-                dv.set_vehicle('Lincoln2017MKZ_LGSVL')
-                dv.setup_apollo(self.destination.x, self.destination.z, self.modules, default_timeout=30)
-                success = True
-                break
-            except:
-                logger.warning('Fail to spin up apollo, try again!')
-                times += 1
-        if not success:
-            raise RuntimeError('Fail to spin up apollo')
+        waiter = ReadinessWaiter()
+
+        # full apollo setup only on the first run or when the health check fails
+        setup_start = time.time()
+        dv, routed = self.apollo_session.prepare(self.ego, self.destination)
+        waiter.record('apollo_setup', time.time() - setup_start)
 
         if self.default_record_folder:
-            util.disnable_modules(dv, self.dy_modules)
-            time.sleep(1)
-            util.enable_modules(dv, self.dy_modules)
-        
-        dv.set_destination(self.destination.x, self.destination.z)
-        logger.info(' --- destination: ' + str(self.destination.x) + ',' + str(self.destination.z))
+            util.disnable_modules(dv, self.dy_modules, waiter, self.module_timeout, self.status_max_age)
+            known_records = util.list_records(self.default_record_folder)
+            util.enable_modules(dv, self.dy_modules, waiter, self.module_timeout, self.status_max_age)
+            waiter.wait_until('recorder_writing', lambda: util.record_writing(self.default_record_folder, known_records), self.recorder_timeout)
         
-        delay_t = 5
-        time.sleep(delay_t)
+        if routed:
+            logger.info(' --- destination (sent with the warm start): ' + str(self.destination.x) + ',' + str(self.destination.z))
+        else:
+            try:
+                routing_time_before = dv.get_route_info()[0]
+            except Exception as e:
+                logger.debug('Fail to read routing info: ' + str(e))
+                routing_time_before = None
+            dv.set_destination(self.destination.x, self.destination.z)
+            logger.info(' --- destination: ' + str(self.destination.x) + ',' + str(self.destination.z))
+
+            def routing_received():
+                routing_time, route_path = dv.get_route_info()
+                if routing_time is not None and routing_time_before is not None:
+                    return routing_time != routing_time_before
+                return len(route_path) > 0
+
+            waiter.wait_until('routing_response', routing_received, self.routing_timeout, 0.2)
+
+        if self.settle_time > 0:
+            time.sleep(self.settle_time)
 
         for npc in self.mutated_npc_list:
             npc.follow_closest_lane(True, 0)
@@ -258,20 +332,23 @@ class Simulator(object):
         for npc in self.fixed_npc_list:
             npc.follow_closest_lane(True, 13.4)
 
-        # Frequency of action change of NPCs
-        total_sim_time = self.total_sim_time
-        action_change_freq = total_sim_time / time_slice_size
-        time_index = 0
+        self.time_index = 0
+        sim_time = 0.0
         
         # record start
-        simulation_recording['frames'][time_index] = {
-            'ego': self.ego.state
-        }
-
-        for npc_i in range(mutated_npc_num):
-            simulation_recording['frames'][time_index]['npc_' + str(npc_i)] = self.mutated_npc_list[npc_i].state
+        simulation_recording.record([agent.state for agent in recorded_agents], sim_time)
+        scorer = OnlineScorer(simulation_recording,
+                              agent_names[1:],
+                              self.yellow_lines,
+                              self.edge_lines,
+                              (self.destination.x, self.destination.z),
+                              self.stop_rules,
+                              self.fine_step if self.adaptive_step else None)
+        stop_reason = None
         
         for t in range(0, int(time_slice_size)):
+            if stop_reason is not None:
+                break
             # check module states
             
             
@@ -294,32 +371,46 @@ class Simulator(object):
                     
                 i += 1        
 
-            for j in range(0, int(action_change_freq) * 10):
-                module_status_mark = True
-                while module_status_mark:
-                    module_status_mark = False
-                    module_status = dv.get_module_status()
-                    for module, status in module_status.items():
-                        if (not status) and (module in self.modules):
-                            logger.warning('$$Simulator$$ Module is closed: ' + module + ' ==> restart')
-                            dv.enable_module(module)
-                            time.sleep(0.5)
-                            module_status_mark = True
-                time_index += 1
-
-                self.sim.run(0.1)
-
-                simulation_recording['frames'][time_index] = {
-                    'ego': self.ego.state
-                }
-
-                for npc_i in range(len(self.mutated_npc_list)):
-                    simulation_recording['frames'][time_index]['npc_' + str(npc_i)] = self.mutated_npc_list[npc_i].state
-
+            # steps in milliseconds, so that every slice ends exactly on the action change boundary
+            slice_ms = int(action_change_freq) * 1000
+            elapsed_ms = 0
+            while elapsed_ms < slice_ms:
+                step_ms = self.next_step_ms(scorer)
+                step_ms = min(step_ms, slice_ms - elapsed_ms)
+                elapsed_ms += step_ms
+
+                # only modules dreamview reports as stopped, as the restart check always did
+                closed_modules = util.modules_in_wrong_state(dv.get_cached_module_status(self.status_max_age), self.modules, True)
+                if len(closed_modules) > 0:
+                    logger.warning('$$Simulator$$ Module is closed: ' + ', '.join(closed_modules) + ' ==> restart')
+                    restart_from_here = dv.get_status_snapshot(self.status_max_age) is None # listener is stale
+                    attempts = 0
+                    while True:
+                        if restart_from_here:
+                            for module in closed_modules:
+                                dv.enable_module(module)
+                        if waiter.wait_until('module_restart', lambda: util.modules_in_state(dv, self.modules, True, self.status_max_age), self.module_timeout):
+                            break
+                        attempts += 1
+                        if attempts >= self.module_restarts:
+                            raise RuntimeError('Apollo modules did not restart after ' + str(attempts) + ' attempts: ' + ', '.join(closed_modules))
+                        # restart requests from the listener did not help, send them from here
+                        restart_from_here = True
+                self.time_index += 1
+
+                self.sim.run(step_ms / 1000.0)
+                sim_time += step_ms / 1000.0
+
+                simulation_recording.record([agent.state for agent in recorded_agents], sim_time)
+                scorer.update()
+
+                stop_reason = scorer.stop_reason(self.accident_happen)
+                if stop_reason is not None:
+                    logger.info(' --- Stop simulation at ' + str(round(sim_time, 1)) + 's: ' + stop_reason)
+                    break
     
         if self.default_record_folder:
-            util.disnable_modules(dv, self.dy_modules)
-            time.sleep(0.5)
+            util.disnable_modules(dv, self.dy_modules, waiter, self.module_timeout, self.status_max_age)
 
         # check new folder and move -> save folder
         if self.default_record_folder:
@@ -337,47 +428,12 @@ class Simulator(object):
         accident_happen = False
         
         '''
-        # Step 1 obtain time
-        simulation_slices = max(simulation_recording['frames'].keys())
-
+        # Step 1 & 2 remaining frames: compute distance and check line error and filter npc_fault
         '''
-        simulation_recording[time_index] = {
-                    'ego': self.ego.transform,
-                    'npc': []
-                }
+        simulation_recording.frames[time_index, agent] = (position, rotation, velocity)
+        agents: ego, npc_0, npc_1, ...
         '''
-        fault = []
-        max_fitness = -1111
-        # Step 2 compute distance and check line error and filter npc_fault
-        for t in range(simulation_slices):
-            simulation_frame = simulation_recording['frames'][t]
-            ego_info = {
-                'state': simulation_frame['ego'],
-                'bbox': simulation_recording['bbox']['ego']
-            }            
-            # compute distance
-            for npc_i in range(len(self.mutated_npc_list)):
-                npc_id = 'npc_' + str(npc_i)
-                npc_info = {
-                    'state': simulation_frame[npc_id],
-                    'bbox': simulation_recording['bbox'][npc_id]
-                }
-                
-                npc_ego_fitness = liability.compute_danger_fitness(ego_info, npc_info, False)
-                
-                if npc_ego_fitness > max_fitness:
-                    max_fitness = npc_ego_fitness
-            
-            # check line
-            for yellow_line in self.yellow_lines:
-                hit_yellow_line = liability.ego_yellow_line_fault(ego_info, yellow_line)
-                if hit_yellow_line:
-                    fault.append('hit_yellow_line')
-            
-            for edge_line in self.edge_lines:
-                hit_edge_line = liability.ego_edge_line_fault(ego_info, edge_line)
-                if hit_edge_line:
-                    fault.append('hit_edge_line')
+        max_fitness, fault = scorer.finish()
             
         # Step 3 if collision, check is npc fault
         '''
@@ -397,6 +453,7 @@ class Simulator(object):
             collision_info['contact'] = contact_loc
 
         '''
+        collision_info = self.collision_info
         if collision_info is not None:
             ego_info = {
                 'state': collision_info['ego'][0],
@@ -423,6 +480,15 @@ class Simulator(object):
 
         if len(fault) == 0:
             fault.append('normal')
+
+        if self.trajectory_folder:
+            collision = None
+            if collision_info is not None:
+                collision = {'frame': collision_info['time'], 'agents': collision_info['agents'], 'contact': collision_info['contact']}
+            try:
+                simulation_recording.save(os.path.join(self.trajectory_folder, case_id + '.npz'), scenario_obj, action_change_freq, collision)
+            except Exception as e:
+                logger.warning('Fail to save trajectory of ' + case_id + ': ' + str(e))
         
         #fitness_score = self.findFitness(deltaDList, dList, self.isHit, hit_time)
         
@@ -430,6 +496,8 @@ class Simulator(object):
         result_dict['fitness'] = max_fitness
         #(fitness_score + self.maxint) / float(len(self.mutated_npc_list) - 1 ) # Try to make sure it is positive
         result_dict['fault'] = fault
+        result_dict['timings'] = waiter.summary()
+        waiter.log()
         
         logger.info(' === Simulation End === ')
 
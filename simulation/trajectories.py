@@ -0,0 +1,165 @@
+import os
+import sys
+import glob
+import json
+import numpy as np
+
+from loguru import logger
+
+# per frame arrays, concatenated over runs
+FRAME_ARRAYS = ('times', 'position', 'rotation', 'velocity')
+# per run arrays, stacked over runs
+RUN_ARRAYS = ('bbox', 'actions', 'action_times', 'collision_frame', 'contact')
+
+def load_trajectory(path):
+    """
+    One saved run (TrajectoryRecorder.save) as a dict of arrays
+    """
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+class TrajectoryArchive(object):
+    """
+    Trajectories of many runs as uncompressed .npy files, opened memory-mapped for bulk analysis.
+    The per-run .npz files are compressed and cannot be mapped, consolidate() unpacks them once:
+        times.npy (F,), position/rotation/velocity.npy (F, A, 3): frames of all runs back to back,
+        offsets.npy (R + 1,): frames of run r are offsets[r]:offsets[r + 1]
+        bbox (R, A, 2, 3), actions (R, npc, T, 2), action_times (R, T), collision_frame (R,), contact (R, 3)
+        index.json: scenario ids, agent names and collision agents of every run
+    All runs share the agent layout (ego + npc_size NPCs) and the number of action slices.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'index.json'), 'r') as f:
+            index = json.load(f)
+        self.scenario_ids = index['scenario_ids']
+        self.agent_names = index['agent_names']
+        self.collision_agents = index['collision_agents']
+        self._rows = {scenario_id: r for r, scenario_id in enumerate(self.scenario_ids)}
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'))
+        self.arrays = {}
+        for name in FRAME_ARRAYS + RUN_ARRAYS:
+            self.arrays[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+
+    @classmethod
+    def consolidate(cls, trajectory_dirs, path):
+        """
+        Unpack the <scenario_id>.npz files of one or more simulation/trajectories folders into an archive at path.
+        Streams run by run into preallocated .npy files, memory use is one run.
+        """
+        if isinstance(trajectory_dirs, str):
+            trajectory_dirs = [trajectory_dirs]
+        files = []
+        for trajectory_dir in trajectory_dirs:
+            files.extend(sorted(glob.glob(os.path.join(trajectory_dir, '*.npz'))))
+        if len(files) == 0:
+            raise RuntimeError('No trajectories in ' + ', '.join(trajectory_dirs) + '.')
+
+        # first pass: sizes and shapes, npz members are read lazily
+        frame_counts = []
+        shapes = None
+        for trajectory_file in files:
+            with np.load(trajectory_file) as data:
+                frame_counts.append(len(data['times']))
+                run_shapes = {name: data[name].shape for name in ('position', 'bbox', 'actions')}
+                run_shapes['position'] = run_shapes['position'][1:]
+                if shapes is None:
+                    shapes = run_shapes
+                    agent_names = [str(name) for name in data['agent_names']]
+                elif run_shapes != shapes:
+                    raise RuntimeError(trajectory_file + ' has another agent or action layout: ' + str(run_shapes) + ' vs ' + str(shapes) + '.')
+
+        os.makedirs(path, exist_ok=True)
+        offsets = np.zeros(len(files) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(frame_counts)
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+
+        runs = len(files)
+        frames = int(offsets[-1])
+        out = {
+            'times': (frames,),
+            'position': (frames,) + shapes['position'],
+            'rotation': (frames,) + shapes['position'],
+            'velocity': (frames,) + shapes['position'],
+            'bbox': (runs,) + shapes['bbox'],
+            'actions': (runs,) + shapes['actions'],
+            'action_times': (runs, shapes['actions'][1]),
+            'collision_frame': (runs,),
+            'contact': (runs, 3)
+        }
+        arrays = {}
+        for name, shape in out.items():
+            dtype = np.int32 if name == 'collision_frame' else np.float32
+            arrays[name] = np.lib.format.open_memmap(os.path.join(path, name + '.npy'), mode='w+', dtype=dtype, shape=shape)
+
+        # second pass: copy
+        scenario_ids = []
+        collision_agents = []
+        for r, trajectory_file in enumerate(files):
+            start, end = offsets[r], offsets[r + 1]
+            with np.load(trajectory_file) as data:
+                for name in FRAME_ARRAYS:
+                    arrays[name][start:end] = data[name]
+                for name in RUN_ARRAYS:
+                    arrays[name][r] = data[name]
+                collision_agents.append([str(agent) for agent in data['collision_agents']])
+            scenario_ids.append(os.path.splitext(os.path.basename(trajectory_file))[0])
+        for array in arrays.values():
+            array.flush()
+        del arrays
+
+        with open(os.path.join(path, 'index.json'), 'w') as f:
+            json.dump({'scenario_ids': scenario_ids, 'agent_names': agent_names, 'collision_agents': collision_agents}, f)
+        return cls(path)
+
+    def __len__(self):
+        return len(self.scenario_ids)
+
+    def __getitem__(self, name):
+        """
+        Memory-mapped array of all runs, e.g. archive['velocity'] (F, A, 3)
+        """
+        return self.arrays[name]
+
+    def row(self, scenario_id):
+        return self._rows[scenario_id]
+
+    def run_of_frame(self):
+        """
+        (F,) run index of every frame, to group frame arrays by run
+        """
+        return np.repeat(np.arange(len(self)), np.diff(self.offsets))
+
+    def reduce_runs(self, values, ufunc=np.maximum):
+        """
+        Per-run reduction of a per-frame array (e.g. speed of one agent), (F, ...) -> (R, ...)
+        """
+        return ufunc.reduceat(values, self.offsets[:-1], axis=0)
+
+    def trajectory(self, scenario_id):
+        """
+        Arrays of one run, views on the memory-mapped files
+        """
+        r = self.row(scenario_id)
+        start, end = self.offsets[r], self.offsets[r + 1]
+        run = {name: self.arrays[name][start:end] for name in FRAME_ARRAYS}
+        for name in RUN_ARRAYS:
+            run[name] = self.arrays[name][r]
+        run['agent_names'] = self.agent_names
+        run['collision_agents'] = self.collision_agents[r]
+        return run
+
+def consolidate_main(argv):
+    """
+    python -m simulation.trajectories <archive dir> <trajectories dir> [<trajectories dir> ...]
+    """
+    if len(argv) < 3:
+        print('usage: python -m simulation.trajectories <archive dir> <trajectories dir> [<trajectories dir> ...]')
+        return 1
+    archive = TrajectoryArchive.consolidate(argv[2:], argv[1])
+    logger.info('Consolidated ' + str(len(archive)) + ' runs, ' + str(archive.offsets[-1]) + ' frames to ' + argv[1])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(consolidate_main(sys.argv))
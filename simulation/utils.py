@@ -1,6 +1,5 @@
 import os
 import shutil
-import time
 
 from loguru import logger
 
@@ -17,25 +16,53 @@ def check_rename_record(default_path, target_path, case_id):
         shutil.move(original_fpath, target_fpath)
         logger.info(' --- Move: ' + original_fpath + ' ==> ' + target_fpath)
 
-def enable_modules(dv, modules):
-    # try 5 times
-    not_all = True
-    while not_all:
-        not_all = False
-        module_status = dv.get_module_status()
-        for module, status in module_status.items():
-            if (not status) and (module in modules):
-                dv.enable_module(module)
-                not_all = True
-        time.sleep(1)
-
-def disnable_modules(dv, modules):
-    not_all = True
-    while not_all:
-        not_all = False
-        module_status = dv.get_module_status()
-        for module, status in module_status.items():
-            if status and (module in modules):
-                dv.disable_module(module)
-                not_all = True
-        time.sleep(1)
+def modules_in_wrong_state(module_status, modules, running):
+    """
+    Modules dreamview reports, but not in the wanted state. Modules missing from the status are left alone.
+    """
+    return [module for module in modules if module in module_status and bool(module_status[module]) != running]
+
+def modules_in_state(dv, modules, running, max_age=2.0):
+    return len(modules_in_wrong_state(dv.get_cached_module_status(max_age), modules, running)) == 0
+
+def enable_modules(dv, modules, waiter, timeout=10.0, max_age=2.0):
+    """
+    Start modules and wait until dreamview reports them running, resend the request at most 3 times
+    """
+    for _ in range(3):
+        for module in modules_in_wrong_state(dv.get_cached_module_status(max_age), modules, True):
+            dv.enable_module(module)
+        if waiter.wait_until('enable_' + '_'.join(modules), lambda: modules_in_state(dv, modules, True, max_age), timeout / 3.0):
+            return True
+    return False
+
+def disnable_modules(dv, modules, waiter, timeout=10.0, max_age=2.0):
+    """
+    Stop modules and wait until dreamview reports them stopped, resend the request at most 3 times
+    """
+    for _ in range(3):
+        for module in modules_in_wrong_state(dv.get_cached_module_status(max_age), modules, False):
+            dv.disable_module(module)
+        if waiter.wait_until('disable_' + '_'.join(modules), lambda: modules_in_state(dv, modules, False, max_age), timeout / 3.0):
+            return True
+    return False
+
+def list_records(default_path):
+    if not os.path.exists(default_path):
+        return []
+    return os.listdir(default_path)
+
+def record_writing(default_path, known_records):
+    """
+    True once a new record folder with a non-empty file exists in default_path
+    """
+    for folder in list_records(default_path):
+        if folder in known_records:
+            continue
+        folder_path = os.path.join(default_path, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for f in os.listdir(folder_path):
+            if os.path.getsize(os.path.join(folder_path, f)) > 0:
+                return True
+    return False
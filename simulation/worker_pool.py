@@ -0,0 +1,39 @@
+import queue
+
+from concurrent.futures import ThreadPoolExecutor
+from loguru import logger
+
+class SimulatorPool(object):
+    """
+    A fixed set of Simulator workers, each bound to its own LGSVL and Apollo host.
+    Jobs are dispatched to whichever simulator is idle.
+    """
+
+    def __init__(self, simulators):
+        self.simulators = simulators
+        self.size = len(simulators)
+
+        self._idle = queue.Queue()
+        for sim in self.simulators:
+            self._idle.put(sim)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='sim_worker')
+        logger.info('Simulator pool with ' + str(self.size) + ' workers')
+
+    def _run_on_worker(self, fn, *args):
+        sim = self._idle.get()
+        try:
+            return fn(sim, *args)
+        finally:
+            self._idle.put(sim)
+
+    def submit(self, fn, *args):
+        """
+        fn(simulator, *args) is executed on the next idle simulator
+        """
+        return self._executor.submit(self._run_on_worker, fn, *args)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        for sim in self.simulators:
+            sim.close()